@@ -10,124 +10,16 @@
 # warnings.filterwarnings("ignore")
 import os
 import sys
-import time
 import argparse
-import subprocess
-from datetime import datetime,date
-from scripts import hmm_run
-from scripts import split_prot
-from scripts import split_nucl
-from scripts import run_prodigal
-from scripts import combine_clean
-
-def check_folder(folder):
-    if os.path.exists(folder):
-        print(f'\nOutput folder {folder} exists! Exiting.\n')
-        exit()
-
-def check_format(check, form):
-    if not check:
-        print(f'Input fasta does not appear to be in the correct "{form}" format! Exiting.')
-        exit()
-
-def check_dependents(db, aux, form):
-    failed = False
-    if not db:
-        try:
-            db = os.environ['VIBRANTDB']
-        except KeyError:
-            print(f'\nSpecify HMM database folder with -d or set the VIBRANTDB env. Exiting.')
-            print(f"Example: export VIBRANTDB='enter_path_here/VIBRANT_v1.2.1/databases/'\n")
-            exit()
-    if db[-1] != '/':
-        db += '/'
-    if not os.path.exists(db + 'KEGG_profiles_prokaryotes.HMM.h3f'):
-        print("Error: could not identify KEGG HMM files in database directory. Please set up HMMs.")
-        failed = True
-    if not os.path.exists(db + 'Pfam-A_v32.HMM.h3f'):
-        print("Error: could not identify Pfam HMM files in database directory. Please set up HMMs.")
-        failed = True
-    if not os.path.exists(db + 'VOGDB94_phage.HMM.h3f'):
-        print("Error: could not identify VOG HMM files in database directory. Please set up HMMs.")
-        failed = True
-    #
-    if not aux:
-        try:
-            aux = os.environ['VIBRANTAUX']
-        except KeyError:
-            print(f'\nSpecify auxiliary files folder with -m or set the VIBRANTAUX env. Exiting.')
-            print(f"Example: export VIBRANTAUX='enter_path_here/VIBRANT_v1.2.1/files/'\n")
-            exit()
-    if aux[-1] != '/':
-        aux += '/'
-    if not os.path.exists(aux + 'VIBRANT_categories.tsv'):
-        print("Error: could not identify VIBRANT_categories.tsv in files directory.")
-        failed = True
-    if not os.path.exists(aux + 'VIBRANT_AMGs.tsv'):
-        print("Error: could not identify VIBRANT_AMGs.tsv in files directory.")
-        failed = True
-    if not os.path.exists(aux + 'VIBRANT_names.tsv'):
-        print("Error: could not identify VIBRANT_names.tsv in files directory.")
-        failed = True
-    #
-    try:
-        subprocess.check_output("which hmmsearch", shell=True)
-    except Exception:
-        print("\nError: hmmsearch cannot be found. Please install HMMER.")
-        failed = True
-    if form == 'nucl':
-        try:
-            subprocess.check_output("which prodigal", shell=True)
-        except Exception:
-            print("\nError: prodigal cannot be found. Please install prodigal. Exiting.\n")
-            failed = True
-    #
-    if failed:
-        print("Exiting.\n")
-        exit()
-    return db, aux
-
-def hmm_parse_threader(folder):
-    os.mkdir(f'{folder}parsed_hmm_results/')
-    files = os.listdir(f'{folder}split_files/')
-    files = [f[0] for f in files if f[-4:] == '.faa']
-
-    holder = []
-    for f in files:
-        s = subprocess.Popen(f'./scripts/hmm_parse.py {f} {folder}', shell=True)
-        holder.append(s)
-    for h in holder:
-        h.wait()
-
-def annotations_threader(folder, aux, form):
-    os.mkdir(f'{folder}annotations_temp/')
-    files = os.listdir(f'{folder}split_files/')
-    files = [f[0] for f in files if f[-4:] == '.faa']
-
-    holder = []
-    for f in files:
-        s = subprocess.Popen(f'./scripts/annotations.py {f} {folder} {aux} {form}', shell=True)
-        holder.append(s)
-    for h in holder:
-        h.wait()
-
-def logit(folder, hold_time, start_time, date_today, program):
-    runtime = round((time.time()-hold_time)/60,2)
-    end_time = datetime.now().strftime("%H:%M")
-    with open(f'{folder}info.log', 'w') as f:
-        cmd = ' '.join(sys.argv)
-        f.write(f'Command:   {cmd}\n')
-        f.write(f'Date:      {date_today} (M/D/Y)\n')
-        f.write(f'Start:     {start_time}\n')
-        f.write(f'End:       {end_time}\n')
-        f.write(f'Runtime:   {runtime} minutes\n')
-        f.write(f'Program:   {program}\n')
+from scripts import api
+from scripts import hmm_engine
+from scripts import daemon
+from scripts import batch
+from scripts import work_queue
+from scripts.run import RunError, base_name
 
 if __name__ == '__main__':
-    program = 'annoVIBRANT v1.0.0'
-    hold_time = time.time()
-    start_time = datetime.now().strftime("%H:%M")
-    date_today = date.today().strftime("%m/%d/%y")
+    program = api.PROGRAM
 
     descript = f"""
     {program}
@@ -152,56 +44,133 @@ if __name__ == '__main__':
     Usage Example:
     annoVIBRANT.py -i fasta -o folder -t threads
 
+    Server Example (databases and tables stay loaded between jobs; only the user running it can send jobs):
+    annoVIBRANT.py --serve annoVIBRANT.sock -t threads
+    annoVIBRANT.py --server annoVIBRANT.sock -i fasta -o folder
+
+    Batch Example (one output folder per sample in -o):
+    annoVIBRANT.py --batch samples.tsv -o folder -t threads
+
+    Update Example (after a new Pfam or VOG release, only the changed databases are searched):
+    annoVIBRANT.py -i fasta -o folder -t threads --update
+
+    Database Example (KEGG only, plus a custom pressed database annotated by profile accession):
+    annoVIBRANT.py -i fasta -o folder --databases KEGG --add-db PHROG,phrogs.hmm,accession,30
+
+    Work Queue Example (searches spread over nodes sharing a file system; same paths on every node):
+    annoVIBRANT.py -i fasta -o folder -t threads --queue shared/queue
+    annoVIBRANT.py --worker shared/queue -t threads   (on each node)
+
+    Python Example (tables returned in memory, from a FASTA file or (name, sequence) records):
+    from scripts.api import Annotator
+    with Annotator(threads=4) as annotator:
+        tables = annotator.annotate(records)   # tables.full, .best, .amg: rows as dicts or .frame()
+
 """
     vibrant = argparse.ArgumentParser(description=descript, formatter_class=argparse.RawTextHelpFormatter, usage=argparse.SUPPRESS)
     vibrant.add_argument('--version', action='version', version=f'{program}')
-    vibrant.add_argument('-i', type=str, nargs=1, required=True, help='input virus scaffolds/genomes or virus proteins')
+    vibrant.add_argument('-i', type=str, nargs=1, default=[''], help='input virus scaffolds/genomes or virus proteins')
     vibrant.add_argument('-f', type=str, nargs=1, default=['nucl'], choices=["nucl", "prot"], help='format of input [nucl]')
     vibrant.add_argument('-o', type=str, nargs=1, default=[''], help="output folder")
     vibrant.add_argument('-t', type=str, nargs=1, default=['1'], help='threads [1]')
     vibrant.add_argument('-s', type=str, nargs=1, default=['40'], help='score threshold for hmmsearch [40]')
     vibrant.add_argument('-d', type=str, nargs=1, default=[''], help='specify HMM database folder or set VIBRANTDB env')
     vibrant.add_argument('-m', type=str, nargs=1, default=[''], help='specify auxiliary files folder or set VIBRANTAUX env')
+    vibrant.add_argument('--databases', type=str, nargs=1, default=['KEGG,Pfam,VOG'], help='comma separated VIBRANT databases to search; dropped ones are not searched [KEGG,Pfam,VOG]')
+    vibrant.add_argument('--add-db', type=str, nargs=1, action='append', default=[], help='also search this pressed HMM database, as name,path[,name|accession[,score]]: the tblout column to annotate with [name] and its own score threshold [-s]; can be repeated')
+    vibrant.add_argument('--engine', type=str, nargs=1, default=['hmmsearch'], choices=hmm_engine.ENGINES, help='HMM search backend: hmmsearch subprocesses or in-process pyhmmer [hmmsearch]')
+    vibrant.add_argument('--shards', type=str, nargs=1, default=['1'], help='split each HMM database into this many shards searched in parallel, for small inputs on many threads [1]')
+    vibrant.add_argument('--cache', type=str, nargs=1, default=[''], help='protein annotation cache file shared across runs, created if needed [off]')
+    vibrant.add_argument('--cache-max', type=str, nargs=1, default=['10000000'], help='maximum cached (protein, database) entries, and scaffolds in --gene-cache [10000000]')
+    vibrant.add_argument('--gene-cache', type=str, nargs=1, default=[''], help='Prodigal gene call cache file shared across runs, created if needed; only new scaffolds are called [off]')
+    vibrant.add_argument('--dedup', action='store_true', help='search identical proteins of a chunk only once; --keep-hits tables then list one copy [off]')
+    vibrant.add_argument('--keep-hits', action='store_true', help='also write all hmmsearch hits to full_hmmsearch_results/ [off]')
+    vibrant.add_argument('--stream', action='store_true', help='pipe hmmsearch results straight into the parser, no raw hit tables; with --keep-hits all hits go to one compressed .hmmtbl.gz per database [off]')
+    vibrant.add_argument('--resume', action='store_true', help='resume an interrupted run in -o, redoing only missing or corrupt steps')
+    vibrant.add_argument('--update', action='store_true', help='annotate a finished run in -o again after database changes: only new databases or those whose files changed are searched, the others reuse the hits stored in -o; --cache is not used')
+    vibrant.add_argument('--batch', type=str, nargs=1, default=[''], help='annotate many samples on one worker pool: a folder of FASTA files or a sample sheet (FASTA, optional tab and output folder, per line); -o is the parent folder')
+    vibrant.add_argument('--serve', type=str, nargs=1, default=[''], help='run as a local annotation server on this Unix socket')
+    vibrant.add_argument('--server', type=str, nargs=1, default=[''], help='send this run to the annotation server on this Unix socket; -s, -t, -d, -m, --databases, --add-db, --engine, --shards, --cache, --gene-cache and --queue are the server\'s')
+    vibrant.add_argument('--queue', type=str, nargs=1, default=[''], help='run the hmmsearch jobs on workers of a work queue in this folder on a shared file system; -o and the databases must be on it too [off]')
+    vibrant.add_argument('--workers', type=str, nargs=1, default=['0'], help='with --queue, also start this many local workers [0]')
+    vibrant.add_argument('--worker', type=str, nargs=1, default=[''], help='run as a worker of the work queue in this folder with -t threads, until its run is done')
     #
     args = vibrant.parse_args()
+    if args.worker[0]:
+        if not api.which('hmmsearch'):
+            print("\nError: hmmsearch cannot be found. Please install HMMER. Exiting.\n")
+            exit()
+        work_queue.Worker(os.path.abspath(args.worker[0]) + '/', int(args.t[0]))
+        exit()
+    serve = args.serve[0]
+    server = args.server[0]
+    sheet = args.batch[0]
     infile = args.i[0]
-    try:
-        temp = infile.rsplit('/',1)[1]
-        base = temp.rsplit('.',1)[0]
-    except IndexError:
-        base = infile.rsplit('.',1)[0]
+    if not infile and not serve and not sheet:
+        print(f'\nInput file (-i) is required. Exiting.\n')
+        exit()
+    base = base_name(infile)
     form = args.f[0]
     score = args.s[0]
     folder = args.o[0]
+    if sheet:
+        if folder and folder[-1] != '/':
+            folder += '/'
+        samples = batch.samples(sheet, folder)
+        if not samples:
+            print(f'\nNo samples found in {sheet}. Exiting.\n')
+            exit()
+        if len({s[1] for s in samples}) < len(samples):
+            print(f'\nSamples in {sheet} share output folders, give them distinct names or folders. Exiting.\n')
+            exit()
+        if folder:
+            os.makedirs(folder, exist_ok=True)
     if not folder:
         folder = f'annoVIBRANT_results_{base}/'
     if folder[-1] != '/':
         folder += '/'
-    threads = int(args.t[0])
-    if threads < 1:
-        print(f'\nThreads must be at least 1. Exiting.\n')
+    resume = args.resume
+    update = args.update
+    if resume and update:
+        print(f'\nUse either --resume or --update. Exiting.\n')
         exit()
-    db = args.d[0]
-    aux = args.m[0]
-    #
-    db, aux = check_dependents(db, aux, form)
-    check_folder(folder)
-    os.mkdir(folder)
+    keep = args.keep_hits
     #
-    if form == 'nucl':
-        check = split_nucl.SplitNucl(infile, folder, threads)
-        check_format(check.check, form)
-        run_prodigal.prodigal(folder)
-    elif form == 'prot':
-        check = split_prot.SplitProt(infile, folder, threads)
-        check_format(check.check, form)
-    
-    #
-    hmm_run.HMMsearch(folder, db, score)
-    hmm_parse_threader(folder)
-    annotations_threader(folder, aux, form)
+    if server:
+        job = {'input': os.path.abspath(infile), 'folder': os.path.abspath(folder) + '/', 'base': base, 'form': form, 'keep': keep, 'resume': resume, 'update': update, 'command': ' '.join(sys.argv)}
+        try:
+            reply = daemon.submit(server, job)
+        except OSError:
+            print(f'\nNo annotation server is listening on {server}. Exiting.\n')
+            exit()
+        if reply['status'] != 'ok':
+            print(f'\n{reply["message"]} Exiting.\n')
+            exit(1)
+        exit()
     #
-    combine_clean.CombineClean(folder, base, aux, form)
+    try:
+        annotator = api.Annotator(db=args.d[0], aux=args.m[0], score=score, threads=int(args.t[0]), databases=args.databases[0], extra=[a[0] for a in args.add_db],
+                                  engine=args.engine[0], shards=int(args.shards[0]), cache=args.cache[0], cache_max=int(args.cache_max[0]), dedup=args.dedup, stream=args.stream,
+                                  queue=args.queue[0], workers=int(args.workers[0]), form='nucl' if serve else form, genes=args.gene_cache[0])
+    except api.SetupError as e:
+        print(f'\n{e}\nExiting.\n')
+        exit()
     #
-    logit(folder, hold_time, start_time, date_today, program)
-
+    with annotator:
+        if serve:
+            try:
+                annotator.serve(serve)
+            except OSError as e:
+                print(f'\n{e} Exiting.\n')
+                exit()
+        elif sheet:
+            failed = annotator.run_batch(samples, form, keep, resume, update)
+            if failed:
+                print(f'\n{len(failed)} of {len(samples)} samples failed. Exiting.\n')
+                exit(1)
+        else:
+            try:
+                annotator.run(infile, folder, form, keep, resume, update, base, ' '.join(sys.argv))
+            except RunError as e:
+                print(f'\n{e} Exiting.\n')
+                exit()
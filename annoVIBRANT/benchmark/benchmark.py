@@ -0,0 +1,220 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+# annoVIBRANT benchmark
+# Runs annoVIBRANT end to end on synthetic input with stand-in hmmsearch and Prodigal
+# (benchmark/bin/) at each thread count, and reports per-stage throughput and peak memory.
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+import synthetic
+
+
+HERE = os.path.dirname(os.path.abspath(__file__)) + '/'
+ANNOVIBRANT = os.path.dirname(HERE.rstrip('/')) + '/'
+
+
+def revision():
+    try:
+        return subprocess.check_output(['git', '-C', ANNOVIBRANT, 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def stages(path):
+    '''
+    Per-stage totals from a run's profile.jsonl. span is first start to last end,
+    so input / span is the stage's throughput with its jobs running in parallel.
+    '''
+    found = {}
+    with open(path) as f:
+        for line in f:
+            job = json.loads(line)
+            s = found.setdefault(job['stage'], {'jobs': 0, 'wall': 0, 'cpu': 0, 'input_bytes': 0, 'max_rss_kb': 0, 'start': job['start'], 'end': job['end']})
+            s['jobs'] += 1
+            s['wall'] += job['wall']
+            s['cpu'] += job['cpu']
+            s['input_bytes'] += job['input_bytes']
+            s['max_rss_kb'] = max(s['max_rss_kb'], job['max_rss_kb'])
+            s['start'] = min(s['start'], job['start'])
+            s['end'] = max(s['end'], job['end'])
+    for s in found.values():
+        s['span'] = s.pop('end') - s.pop('start')
+        s['mb_per_s'] = s['input_bytes'] / 1048576 / s['span'] if s['span'] else 0
+    return found
+
+def median(runs):
+    runs = sorted(runs, key=lambda r: r['wall'])
+    return runs[(len(runs)-1)//2]
+
+
+class Benchmark:
+    '''
+    Synthetic data goes to <outdir>data/, each run to <outdir>runs/t<threads>.<repeat>/
+    (removed afterwards unless keep), and the results to report.json and report.txt.
+    The report of each thread count is its median repeat by wall time.
+    '''
+    def __init__(self, outdir, config, threads, repeats, extra, keep=False, compare=''):
+        self.outdir = outdir
+        self.config = config
+        self.data = f'{outdir}data/'
+        os.makedirs(f'{outdir}runs/', exist_ok=True)
+        os.makedirs(self.data, exist_ok=True)
+        self.make_data()
+
+        self.runs = []
+        for t in threads:
+            for r in range(repeats):
+                self.runs.append(self.run(t, r, extra, keep))
+        self.report = {'date': datetime.now().isoformat(timespec='seconds'), 'revision': revision(), 'cpus': os.cpu_count(),
+                       'python': platform.python_version(), 'machine': platform.machine(), 'config': config, 'args': extra, 'runs': self.runs}
+        with open(f'{outdir}report.json', 'w') as f:
+            json.dump(self.report, f, indent=1)
+        previous = None
+        if compare:
+            with open(compare) as f:
+                previous = json.load(f)
+        lines = self.table(previous)
+        with open(f'{outdir}report.txt', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        print('\n'.join(lines))
+
+    def make_data(self):
+        c = self.config
+        print(f'Writing synthetic {c["form"]} input and databases to {self.data}', flush=True)
+        self.infile = f'{self.data}input.{"faa" if c["form"] == "prot" else "fna"}'
+        c['sequences'] = synthetic.write_fasta(self.infile, c['form'], c['size'], c['length_mean'], c['length_sd'], c['gene_mean'], c['gene_sd'], c['repeat'], c['seed'])
+        c['input_bytes'] = os.path.getsize(self.infile)
+        synthetic.write_databases(f'{self.data}db/', c['profiles'], c['seed'])
+        synthetic.write_aux(f'{self.data}aux/', c['profiles'], c['seed'])
+
+    def run(self, threads, repeat, extra, keep):
+        c = self.config
+        folder = f'{self.outdir}runs/t{threads}.{repeat}/'
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        env = dict(os.environ)
+        env['PATH'] = f'{HERE}bin:{env.get("PATH", "")}'
+        env['PYTHONPATH'] = f'{ANNOVIBRANT}scripts'
+        env['ANNOVIBRANT_BENCH_HMMSEARCH_RATE'] = str(c['hmmsearch_rate'])
+        env['ANNOVIBRANT_BENCH_PRODIGAL_RATE'] = str(c['prodigal_rate'])
+        env['ANNOVIBRANT_BENCH_BUCKETS'] = str(max(1, round(c['profiles'] / c['hits']))) if c['hits'] else str(2**31)
+        cmd = [sys.executable, f'{ANNOVIBRANT}annoVIBRANT.py', '-i', self.infile, '-f', c['form'], '-o', folder, '-t', str(threads),
+               '-d', f'{self.data}db/', '-m', f'{self.data}aux/'] + shlex.split(extra)
+        print(f'Running {threads} thread(s), repeat {repeat+1}', flush=True)
+        start = time.time()
+        p = subprocess.Popen(cmd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        _,status,ru = os.wait4(p.pid, 0) # ru_maxrss: the largest process of the run, annoVIBRANT or a tool
+        wall = time.time() - start
+        if os.waitstatus_to_exitcode(status) or not os.path.exists(f'{folder}profile.jsonl'):
+            print(f'\nannoVIBRANT failed at {threads} thread(s): {" ".join(cmd)}\nExiting.\n')
+            exit(1)
+        result = {'threads': threads, 'repeat': repeat, 'wall': wall, 'cpu': ru.ru_utime + ru.ru_stime, 'peak_rss_kb': ru.ru_maxrss,
+                  'mb_per_s': c['input_bytes'] / 1048576 / wall, 'stages': stages(f'{folder}profile.jsonl')}
+        if not keep:
+            shutil.rmtree(folder)
+        return result
+
+    def table(self, previous=None):
+        c = self.config
+        best = {}
+        for r in self.runs:
+            best.setdefault(r['threads'], []).append(r)
+        best = {t: median(runs) for t,runs in best.items()}
+        before = {}
+        if previous:
+            for r in previous['runs']:
+                before.setdefault(r['threads'], []).append(r)
+            before = {t: median(runs) for t,runs in before.items()}
+        base = best[min(best)]
+
+        lines = [f'annoVIBRANT benchmark  {self.report["date"]}  revision {self.report["revision"] or "-"}  {self.report["cpus"]} CPUs',
+                 f'Input: {c["form"]}, {c["sequences"]} sequences, {c["input_bytes"]/1048576:.2f} MB; {c["profiles"]} profiles per database'
+                 + (f'; annoVIBRANT {self.report["args"]}' if self.report['args'] else ''), '']
+        if previous:
+            lines.append(f'Compared with {previous["date"]} revision {previous["revision"] or "-"}')
+            if previous['config'] != c or previous['args'] != self.report['args']:
+                lines.append('Warning: the compared report used different input or options.')
+            lines.append('')
+        header = 'Threads   wall (s)    CPU (s)  speedup  efficiency     MB/s  peak RSS (MB)'
+        lines.append(header + ('  previous wall (s)  change' if previous else ''))
+        for t,r in sorted(best.items()):
+            speedup = base['wall'] / r['wall'] * base['threads']
+            line = f'{t:7} {r["wall"]:10.2f} {r["cpu"]:10.2f} {speedup:8.2f} {speedup/t:11.0%} {r["mb_per_s"]:8.3f} {r["peak_rss_kb"]/1024:14.1f}'
+            if t in before:
+                line += f' {before[t]["wall"]:18.2f} {r["wall"]/before[t]["wall"]-1:+7.1%}'
+            lines.append(line)
+
+        names = []
+        for r in best.values():
+            names += [s for s in r['stages'] if s not in names]
+        lines += ['', 'Stage throughput, MB/s over the stage span (input MB / first start to last end)']
+        lines.append('Stage     ' + ''.join(f'{"t=" + str(t):>10}' for t in sorted(best)))
+        for s in names:
+            lines.append(f'{s:10}' + ''.join(f'{best[t]["stages"][s]["mb_per_s"]:10.3f}' if s in best[t]['stages'] else f'{"-":>10}' for t in sorted(best)))
+        lines += ['', 'Stage wall (s), summed over jobs / CPU (s) / peak RSS (MB)']
+        for t in sorted(best):
+            lines.append(f'{t} thread(s)')
+            for s,v in best[t]['stages'].items():
+                lines.append(f'  {s:10} {v["jobs"]:6} jobs {v["wall"]:10.2f} {v["cpu"]:10.2f} {v["max_rss_kb"]/1024:10.1f}')
+        return lines
+
+
+if __name__ == '__main__':
+    descript = """
+    annoVIBRANT benchmark
+
+    Generates a synthetic input FASTA and VIBRANT-like databases, runs annoVIBRANT end to end
+    with stand-in hmmsearch and Prodigal at each thread count and writes report.json and report.txt.
+    The stand-ins burn CPU to mimic the real tools' speed; set their rates to match your machine.
+
+    Usage Example:
+    benchmark.py -o bench/ -t 1,2,4,8 --size 5000000
+    benchmark.py -o bench_new/ -t 1,2,4,8 --size 5000000 --args "--stream --dedup" --compare bench/report.json
+
+"""
+    bench = argparse.ArgumentParser(description=descript, formatter_class=argparse.RawTextHelpFormatter, usage=argparse.SUPPRESS)
+    bench.add_argument('-o', type=str, nargs=1, default=['annoVIBRANT_benchmark/'], help='output folder [annoVIBRANT_benchmark/]')
+    bench.add_argument('-f', type=str, nargs=1, default=['nucl'], choices=['nucl', 'prot'], help='format of the synthetic input [nucl]')
+    bench.add_argument('-t', type=str, nargs=1, default=[''], help='comma separated thread counts [1, 2, 4 ... up to the CPU count]')
+    bench.add_argument('--size', type=str, nargs=1, default=['2000000'], help='input size in bases or residues [2000000]')
+    bench.add_argument('--length-mean', type=str, nargs=1, default=['20000'], help='mean scaffold length (nucl) [20000]')
+    bench.add_argument('--length-sd', type=str, nargs=1, default=['20000'], help='scaffold length standard deviation (nucl) [20000]')
+    bench.add_argument('--gene-mean', type=str, nargs=1, default=['250'], help='mean protein length in residues [250]')
+    bench.add_argument('--gene-sd', type=str, nargs=1, default=['150'], help='protein length standard deviation [150]')
+    bench.add_argument('--repeat', type=str, nargs=1, default=['0.0'], help='fraction of genes that copy an earlier one, for --dedup and --cache [0.0]')
+    bench.add_argument('--profiles', type=str, nargs=1, default=['300'], help='profiles per database [300]')
+    bench.add_argument('--hits', type=str, nargs=1, default=['0.3'], help='expected hits per protein per database [0.3]')
+    bench.add_argument('--hmmsearch-rate', type=str, nargs=1, default=['2e10'], help='stand-in hmmsearch speed in residues x model positions per CPU second, 0 for no delay [2e10]')
+    bench.add_argument('--prodigal-rate', type=str, nargs=1, default=['1e6'], help='stand-in Prodigal speed in bases per CPU second, 0 for no delay [1e6]')
+    bench.add_argument('--repeats', type=str, nargs=1, default=['1'], help='runs per thread count, the median is reported [1]')
+    bench.add_argument('--seed', type=str, nargs=1, default=['1'], help='random seed of the synthetic data [1]')
+    bench.add_argument('--args', type=str, nargs=1, default=[''], help='extra annoVIBRANT options, quoted')
+    bench.add_argument('--compare', type=str, nargs=1, default=[''], help='report.json of an earlier benchmark to compare wall times with')
+    bench.add_argument('--keep-runs', action='store_true', help='keep the annoVIBRANT output folders in runs/')
+    args = bench.parse_args()
+
+    outdir = args.o[0]
+    if outdir[-1] != '/':
+        outdir += '/'
+    if args.t[0]:
+        threads = [int(t) for t in args.t[0].split(',')]
+    else:
+        threads = [1]
+        while threads[-1] * 2 <= os.cpu_count():
+            threads.append(threads[-1] * 2)
+    if min(threads) < 1:
+        print(f'\nThreads must be at least 1. Exiting.\n')
+        exit()
+    config = {'form': args.f[0], 'size': int(float(args.size[0])), 'length_mean': float(args.length_mean[0]), 'length_sd': float(args.length_sd[0]),
+              'gene_mean': float(args.gene_mean[0]), 'gene_sd': float(args.gene_sd[0]), 'repeat': float(args.repeat[0]), 'profiles': int(args.profiles[0]),
+              'hits': float(args.hits[0]), 'hmmsearch_rate': float(args.hmmsearch_rate[0]), 'prodigal_rate': float(args.prodigal_rate[0]), 'seed': int(args.seed[0])}
+    Benchmark(outdir, config, threads, int(args.repeats[0]), args.args[0], args.keep_runs, args.compare[0])
@@ -0,0 +1,145 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import math
+import random
+import itertools
+
+
+BASES = 'TCAG'
+AMINO = 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'
+CODONS = {a+b+c: AMINO[i] for i,(a,b,c) in enumerate(itertools.product(BASES, repeat=3))}
+SENSE = [c for c,aa in CODONS.items() if aa != '*']
+STOPS = [c for c,aa in CODONS.items() if aa == '*']
+RESIDUES = 'ACDEFGHIKLMNPQRSTVWY'
+COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+# (database, HMM file, annotation column of the tblout, accession format)
+DATABASES = [('KEGG', 'KEGG_profiles_prokaryotes.HMM', 'K{:05d}', '-'),
+             ('Pfam', 'Pfam-A_v32.HMM', 'PF{:05d}.{}', 'PF{:05d}.{}'),
+             ('VOG', 'VOGDB94_phage.HMM', 'VOG{:05d}', '-')]
+
+
+def lognormal(rng, mean, sd):
+    '''
+    Draw with the given mean and standard deviation.
+    '''
+    sigma = math.sqrt(math.log(1 + (sd/mean)**2))
+    return rng.lognormvariate(math.log(mean) - sigma**2/2, sigma)
+
+def reverse(seq):
+    return seq.translate(COMPLEMENT)[::-1]
+
+def wrap(seq, width=60):
+    return '\n'.join(seq[i:i+width] for i in range(0, len(seq), width))
+
+
+class Genes:
+    '''
+    Coding sequences of lognormal length (in amino acids, at least 100). A repeat
+    fraction of them are copies of earlier genes, so some proteins are identical.
+    '''
+    def __init__(self, rng, mean, sd, repeat):
+        self.rng = rng
+        self.mean = mean
+        self.sd = sd
+        self.repeat = repeat
+        self.seen = []
+
+    def protein(self):
+        if self.seen and self.rng.random() < self.repeat:
+            return self.rng.choice(self.seen)
+        n = max(100, int(lognormal(self.rng, self.mean, self.sd)))
+        seq = 'M' + ''.join(self.rng.choices(RESIDUES, k=n-1))
+        self.remember(seq)
+        return seq
+
+    def gene(self):
+        if self.seen and self.rng.random() < self.repeat:
+            return self.rng.choice(self.seen)
+        n = max(100, int(lognormal(self.rng, self.mean, self.sd)))
+        seq = 'ATG' + ''.join(self.rng.choices(SENSE, k=n-2)) + self.rng.choice(STOPS)
+        self.remember(seq)
+        return seq
+
+    def remember(self, seq):
+        if len(self.seen) < 1000:
+            self.seen.append(seq)
+        else:
+            self.seen[self.rng.randrange(1000)] = seq
+
+
+def write_fasta(path, form, size, mean, sd, gene_mean, gene_sd, repeat, seed):
+    '''
+    Nucleotide scaffolds (genes on both strands between short random spacers) or
+    proteins, of lognormal length, until size bases or residues are written.
+    Returns the number of sequences.
+    '''
+    rng = random.Random(seed)
+    genes = Genes(rng, gene_mean, gene_sd, repeat)
+    written = 0
+    n = 0
+    with open(path, 'w') as out:
+        while written < size:
+            n += 1
+            if form == 'prot':
+                seq = genes.protein()
+                out.write(f'>bench_protein_{n}\n{wrap(seq)}\n')
+            else:
+                length = max(1000, int(lognormal(rng, mean, sd)))
+                parts = []
+                total = 0
+                while total < length:
+                    spacer = ''.join(rng.choices('ACGT', k=rng.randint(10, 150)))
+                    gene = genes.gene()
+                    if rng.random() < 0.5:
+                        gene = reverse(gene)
+                    parts += [spacer, gene]
+                    total += len(spacer) + len(gene)
+                seq = ''.join(parts)[:length]
+                out.write(f'>bench_scaffold_{n} synthetic\n{wrap(seq)}\n')
+            written += len(seq)
+    return n
+
+def write_databases(db, profiles, seed):
+    '''
+    Text HMM files with NAME, ACC and LENG for the stand-in hmmsearch, and empty
+    pressed files so annoVIBRANT finds them.
+    '''
+    rng = random.Random(seed)
+    os.makedirs(db, exist_ok=True)
+    for name,hmm,label,acc in DATABASES:
+        with open(f'{db}{hmm}', 'w') as out:
+            for i in range(profiles):
+                version = i % 30 + 1
+                out.write('HMMER3/f [3.1b2 | February 2015]\n')
+                out.write(f'NAME  {label.format(i, version)}\n')
+                if acc != '-':
+                    out.write(f'ACC   {acc.format(i, version)}\n')
+                out.write(f'DESC  synthetic {name} profile {i}\n')
+                out.write(f'LENG  {rng.randint(50, 500)}\n')
+                out.write('ALPH  amino\n//\n')
+        for ext in ('h3f', 'h3i', 'h3m', 'h3p'):
+            open(f'{db}{hmm}.{ext}', 'w').close()
+
+def write_aux(aux, profiles, seed):
+    '''
+    VIBRANT auxiliary tables covering the synthetic profiles.
+    '''
+    rng = random.Random(seed)
+    os.makedirs(aux, exist_ok=True)
+    accs = {name: [label.format(i, i % 30 + 1) if acc == '-' else acc.format(i, i % 30 + 1) for i in range(profiles)] for name,_,label,acc in DATABASES}
+    with open(f'{aux}VIBRANT_names.tsv', 'w') as out: # no final newline, as in VIBRANT
+        out.write('\n'.join(f'{acc}\tsynthetic {name} protein {acc}' for name,found in accs.items() for acc in found))
+    kegg = accs['KEGG']
+    with open(f'{aux}VIBRANT_AMGs.tsv', 'w') as out:
+        out.write('KO\n')
+        for acc in kegg[::10]:
+            out.write(f'{acc}\n')
+    with open(f'{aux}VIBRANT_categories.tsv', 'w') as out:
+        out.write('acc\tvscore\n')
+        out.write('\n'.join(f'{acc}\t{rng.randint(0, 100)}' for found in accs.values() for acc in found))
+    with open(f'{aux}VIBRANT_KEGG_pathways_summary.tsv', 'w') as out:
+        for i in range(max(1, profiles // 20)):
+            out.write(f'map{i:05d}\tSynthetic metabolism {i % 5}\tSynthetic pathway {i}\t{"~".join(kegg[i::max(1, profiles // 20)])}\n')
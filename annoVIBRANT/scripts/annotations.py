@@ -2,40 +2,42 @@
 # Author: Kristopher Kieft
 # University of Wisconsin-Madison
 
+import os
 import sys
 from fasta_parse import fasta_parse
+from aux_tables import AuxTables
+from databases import VIBRANT, AMG
+
+
+TABLES = None # set by the parent process before forking annotation workers
 
 
 class Annotations:
-    def __init__(self, base, folder, aux, form):
+    '''
+    databases: names of the searched databases, in registry order; one block of columns each.
+    '''
+    def __init__(self, base, folder, aux, form, databases=None):
         self.base = base
         self.folder = folder
         self.aux = aux
         self.form = form
+        self.databases = databases or [name for name,_,_ in VIBRANT]
 
         self.get_lists()
         self.make_accnos()
         self.get_annos()
+        self.expand()
         self.write_annos()
 
 
 
     def get_lists(self):
-        with open(f'{self.aux}VIBRANT_names.tsv') as f:
-            items = f.read().replace('\n', '\t').split('\t')
-            self.names = {items[i]:items[i+1] for i in range(0,len(items),2)}
-            self.names.pop('', None)
-        
-        with open(f'{self.aux}VIBRANT_AMGs.tsv') as f:
-            next(f)
-            self.amgs = set(f.read().split('\n'))
-            self.amgs.discard('')
-
-        with open(f'{self.aux}VIBRANT_categories.tsv') as f:
-            next(f)
-            items = f.read().replace('\n', '\t').split('\t')
-            self.cats = {items[i]:(float(items[i+1])/100) for i in range(0,len(items),2)}
-            self.cats.pop('', None)
+        tables = TABLES
+        if not tables or tables.aux != self.aux:
+            tables = AuxTables(self.aux)
+        self.names = tables.names
+        self.amgs = tables.amgs
+        self.cats = tables.cats
     
     def make_accnos(self):
         self.accnos_file = f'{self.folder}split_files/{self.base}.accnos'
@@ -49,78 +51,82 @@ class Annotations:
                     out.write(f'{name}\n')
     
     
+    def parsed(self, name):
+        '''
+        Fresh hmmsearch results plus any hits taken from the hit cache.
+        '''
+        for f in (f'{self.folder}parsed_hmm_results/{self.base}.{name}.tsv', f'{self.folder}parsed_hmm_results/{self.base}.{name}.cached.tsv'):
+            if os.path.exists(f):
+                with open(f) as infile:
+                    yield infile
+
     def get_annos(self):
         self.annotations = {}
-        with open(f'{self.folder}parsed_hmm_results/{self.base}.KEGG.tsv') as infile:
-            next(infile)
-            for line in infile:
-                line = line.strip('\n').split('\t')
-                data = (line[1], float(line[2]), float(line[3]))
-                k = self.annotations.setdefault(line[0], [('', '', ''), ('', '', ''), ('', '', '')])
-                k[0] = data
-        
-        with open(f'{self.folder}parsed_hmm_results/{self.base}.Pfam.tsv') as infile:
-            next(infile)
-            for line in infile:
-                line = line.strip('\n').split('\t')
-                data = (line[1], float(line[2]), float(line[3]))
-                p = self.annotations.setdefault(line[0], [('', '', ''), ('', '', ''), ('', '', '')])
-                p[1] = data
-        
-        with open(f'{self.folder}parsed_hmm_results/{self.base}.VOG.tsv') as infile:
-            next(infile)
-            for line in infile:
-                line = line.strip('\n').split('\t')
-                data = (line[1], float(line[2]), float(line[3]))
-                v = self.annotations.setdefault(line[0], [('', '', ''), ('', '', ''), ('', '', '')])
-                v[2] = data
+        for i,name in enumerate(self.databases):
+            for infile in self.parsed(name):
+                next(infile)
+                for line in infile:
+                    line = line.strip('\n').split('\t')
+                    data = (line[1], float(line[2]), float(line[3]))
+                    a = self.annotations.setdefault(line[0], [('', '', '')] * len(self.databases))
+                    a[i] = data
     
 
+    def expand(self):
+        '''
+        Copies of a protein searched only once in this chunk (dedup) take its annotations.
+        '''
+        dups = f'{self.folder}split_files/{self.base}.dups.tsv'
+        if not os.path.exists(dups):
+            return
+        with open(dups) as f:
+            for line in f:
+                prot,first = line.strip('\n').split('\t')
+                if first in self.annotations:
+                    self.annotations[prot] = self.annotations[first]
+
     def write_annos(self):
+        empty = [('', '', '')] * len(self.databases)
         with open(self.accnos_file) as acc, open(f'{self.folder}annotations_temp/{self.base}.full.tsv', 'w') as full, open(f'{self.folder}annotations_temp/{self.base}.best.tsv', 'w') as best, open(f'{self.folder}annotations_temp/{self.base}.amgs.tsv', 'w') as metabolic:
             for prot in acc:
                 amg = ''
                 prot = prot.strip('\n')
-                kegg, pfam, vog = self.annotations.get(prot, [('', '', ''), ('', '', ''), ('', '', '')])
-                k0,k1,k2 = kegg
-                p0,p1,p2 = pfam
-                v0,v1,v2 = vog
+                columns = []
                 score = ('','','','')
-                k_name,k_cat,p_name,p_cat,v_name,v_cat = '','','','','',''
-                
-                if k0:
-                    k_name = self.names.get(k0, 'hypothetical protein')
-                    k_cat = self.cats.get(k0, 0)
-                    if k0 in self.amgs:
-                        amg = 'AMG'
-                    score = (k0,k1,k2,k_name)
-                if p0:
-                    p_name = self.names.get(p0, 'hypothetical protein')
-                    p_cat = self.cats.get(p0, 0)
-                    try:
-                        if p2 >= score[2]:
-                            score = (p0,p1,p2,p_name)
-                    except TypeError:
-                        score = (p0,p1,p2,p_name)
-                if v0:
-                    v_name = self.names.get(v0, 'hypothetical protein')
-                    v_cat = self.cats.get(v0, 0)
-                    try:
-                        if v2 >= score[2]:
-                            score = (v0,v1,v2,v_name)
-                    except TypeError:
-                        score = (v0,v1,v2,v_name)
+                kegg = ('','','','')
+                for name,(a0,a1,a2) in zip(self.databases, self.annotations.get(prot, empty)):
+                    a_name,a_cat = '',''
+                    if a0:
+                        a_name = self.names.get(a0, 'hypothetical protein')
+                        a_cat = self.cats.get(a0, 0)
+                        if name == AMG:
+                            kegg = (a0,a_name,a1,a2)
+                            if a0 in self.amgs:
+                                amg = 'AMG'
+                        if not score[0] or a2 >= score[2]: # later databases win ties
+                            score = (a0,a1,a2,a_name)
+                    columns.append(a0)
+                    if name == AMG:
+                        columns.append(amg)
+                    columns += [a_name,a1,a2,a_cat]
 
                 prot = prot.replace('$~&', ' ')
                 scaffold = prot.rsplit('_',1)[0]
-                full.write(f'{prot}\t{scaffold}\t{k0}\t{amg}\t{k_name}\t{k1}\t{k2}\t{k_cat}\t{p0}\t{p_name}\t{p1}\t{p2}\t{p_cat}\t{v0}\t{v_name}\t{v1}\t{v2}\t{v_cat}\n')
+                full.write('\t'.join(str(c) for c in [prot,scaffold] + columns) + '\n')
 
                 s0,s1,s2,s_name = score
                 best.write(f'{prot}\t{scaffold}\t{s0}\t{s_name}\t{s1}\t{s2}\n')
 
                 if amg:
+                    k0,k_name,k1,k2 = kegg
                     metabolic.write(f'{prot}\t{scaffold}\t{k0}\t{k_name}\t{k1}\t{k2}\n')
     
 
+def annotate(base, folder, aux, form, databases=None):
+    '''
+    Process pool entry point; nothing large is sent back to the parent.
+    '''
+    Annotations(base, folder, aux, form, databases)
+
 if __name__ == '__main__':
     Annotations(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
\ No newline at end of file
@@ -0,0 +1,257 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import shutil
+import tempfile
+import threading
+import subprocess
+from scripts import hit_cache
+from scripts import gene_cache
+from scripts import aux_tables
+from scripts import hmm_engine
+from scripts import hmm_shards
+from scripts import databases
+from scripts import daemon
+from scripts import batch
+from scripts import work_queue
+from scripts.pipeline import pools
+from scripts.run import Run, base_name
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+PROGRAM = 'annoVIBRANT v1.0.0'
+# table name: file name in annotations/ without _<sample>.tsv
+TABLES = {'full': 'VIBRANT_full_annotations',
+          'best': 'VIBRANT_best_annotations',
+          'amg': 'VIBRANT_AMG_individuals',
+          'amg_counts': 'VIBRANT_AMG_counts',
+          'amg_pathways': 'VIBRANT_AMG_pathways'}
+NUMERIC = ('evalue', 'score', 'v-score', 'AMG count', 'Total AMGs') # also with a database label in front
+TEMP = '/dev/shm' if os.access('/dev/shm', os.W_OK) else None # in memory where available
+
+
+class SetupError(Exception):
+    pass
+
+
+def which(program):
+    try:
+        subprocess.check_output(f"which {program}", shell=True)
+        return True
+    except Exception:
+        return False
+
+def check_dependents(db, aux, form, engine, shards, names, extra):
+    '''
+    Database and auxiliary folders (from VIBRANTDB and VIBRANTAUX if not given), the
+    database registry and the programs needed. Returns db, aux, registry.
+    Raises SetupError listing everything missing.
+    '''
+    failed = []
+    if not db:
+        try:
+            db = os.environ['VIBRANTDB']
+        except KeyError:
+            raise SetupError("Specify HMM database folder with -d or set the VIBRANTDB env.\nExample: export VIBRANTDB='enter_path_here/VIBRANT_v1.2.1/databases/'")
+    if db[-1] != '/':
+        db += '/'
+    try:
+        registry = databases.registry(db, names, extra)
+    except ValueError as e:
+        raise SetupError(str(e))
+    for name,hmm,_,_ in registry:
+        if os.path.exists(hmm + '.h3f'):
+            continue
+        if hmm.startswith(db):
+            failed.append(f"Error: could not identify {name} HMM files in database directory. Please set up HMMs.")
+        else:
+            failed.append(f"Error: could not identify pressed {name} HMM files at {hmm}. Please run hmmpress on it.")
+    #
+    if not aux:
+        try:
+            aux = os.environ['VIBRANTAUX']
+        except KeyError:
+            raise SetupError("Specify auxiliary files folder with -m or set the VIBRANTAUX env.\nExample: export VIBRANTAUX='enter_path_here/VIBRANT_v1.2.1/files/'")
+    if aux[-1] != '/':
+        aux += '/'
+    if not aux_tables.check_index(aux): # index is rebuilt from the TSVs, they must all be there
+        for f in aux_tables.SOURCES:
+            if not os.path.exists(aux + f):
+                failed.append(f"Error: could not identify {f} in files directory.")
+    #
+    if engine == 'pyhmmer':
+        if not hmm_engine.pyhmmer:
+            failed.append("Error: pyhmmer cannot be imported. Please install pyhmmer or use --engine hmmsearch.")
+    else:
+        if not which('hmmsearch'):
+            failed.append("Error: hmmsearch cannot be found. Please install HMMER.")
+        if shards > 1 and not which('hmmpress'):
+            failed.append("Error: hmmpress cannot be found to build HMM shards. Please install HMMER.")
+    if form == 'nucl' and not which('prodigal'):
+        failed.append("Error: prodigal cannot be found. Please install prodigal.")
+    #
+    if failed:
+        raise SetupError('\n'.join(failed))
+    return db, aux, registry
+
+
+class Table:
+    '''
+    One annotation table in memory: its columns and rows of strings, in file order.
+    Iterating gives each row as a dict; frame() gives a pandas DataFrame with the
+    E-value, score and count columns as numbers (empty cells as NaN).
+    '''
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+    @classmethod
+    def read(cls, path):
+        with open(path) as f:
+            columns = next(f).rstrip('\n').split('\t')
+            return cls(columns, [line.rstrip('\n').split('\t') for line in f])
+
+    def __iter__(self):
+        return (dict(zip(self.columns, row)) for row in self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def frame(self):
+        if not pandas:
+            raise ImportError('pandas cannot be imported. Please install pandas for DataFrames.')
+        frame = pandas.DataFrame(self.rows, columns=self.columns)
+        for col in self.columns:
+            if col in NUMERIC or col.split(' ', 1)[-1] in NUMERIC:
+                frame[col] = pandas.to_numeric(frame[col], errors='coerce')
+        return frame
+
+
+class Annotations:
+    '''
+    The tables of a run: full, best, amg (AMG individuals), amg_counts and amg_pathways,
+    from {table: (columns, rows)} as built by CombineClean with memory.
+    read() gives those of a finished run on disk.
+    '''
+    def __init__(self, tables):
+        for name in TABLES:
+            setattr(self, name, Table(*tables[name]))
+
+    @classmethod
+    def read(cls, folder, base):
+        tables = {}
+        for name,table in TABLES.items():
+            t = Table.read(f'{folder}annotations/{table}_{base}.tsv')
+            tables[name] = (t.columns, t.rows)
+        return cls(tables)
+
+
+class Annotator:
+    '''
+    annoVIBRANT as a library; the command line is a thin wrapper around it.
+    The database registry, auxiliary tables, search engine, shards, hit and gene caches and work
+    queue are set up once, and the thread and process pools started on first use and kept,
+    so repeated small annotations pay none of that again (as with the server).
+    form: the input format to check programs for, Prodigal is needed for nucl.
+    Arguments are those of the command line; raises SetupError if something is missing.
+    '''
+    def __init__(self, db='', aux='', score='40', threads=1, databases='KEGG,Pfam,VOG', extra=(), engine='hmmsearch', shards=1, cache='', cache_max=10000000, dedup=False, stream=False, queue='', workers=0, form='nucl', genes=''):
+        if threads < 1:
+            raise SetupError('Threads must be at least 1.')
+        if shards < 1:
+            raise SetupError('Shards must be at least 1.')
+        if queue and (engine != 'hmmsearch' or stream):
+            raise SetupError('--queue runs hmmsearch tblouts on the workers, it cannot be used with --engine pyhmmer or --stream.')
+        if workers and not queue:
+            raise SetupError('--workers needs --queue.')
+        db, aux, registry = check_dependents(db, aux, form, engine, shards, databases, extra)
+        self.params = {'program': PROGRAM, 'form': form, 'score': score, 'threads': threads, 'db': db, 'databases': registry, 'aux': aux, 'keep': False, 'engine': engine, 'shards': shards, 'dedup': dedup, 'stream': stream}
+        self.cache = hit_cache.HitCache(cache, cache_max) if cache else None
+        self.genes = gene_cache.GeneCache(genes, cache_max) if genes else None
+        self.tables = aux_tables.AuxTables(aux)
+        if engine == 'pyhmmer':
+            self.engine = hmm_engine.PyHMMER(score)
+            self.shards = {name: [hmm] * shards for name,hmm,_,_ in registry} # sliced in memory
+        else:
+            self.engine = None
+            try:
+                self.shards = hmm_shards.shard_databases(registry, shards)
+            except hmm_shards.ShardError as e:
+                raise SetupError(str(e))
+        self.queue = work_queue.WorkQueue(os.path.abspath(queue) + '/', workers) if queue else None
+        self.pools = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pools:
+            self.pools[1].shutdown()
+            self.pools = None
+        if self.queue:
+            self.queue.stop()
+            self.queue = None
+
+    def shared(self):
+        with self.lock: # no run is in flight before the pools exist, so nothing is forked mid-Popen
+            if not self.pools:
+                self.pools = pools(self.params['threads'], self.tables)
+            return self.pools
+
+    def run(self, infile, folder, form='nucl', keep=False, resume=False, update=False, base='', cmd=None):
+        '''
+        Annotate infile into folder, tables on disk as from the command line.
+        Raises RunError (RunComplete if there is nothing to do).
+        '''
+        if folder[-1] != '/':
+            folder += '/'
+        pool, procs = self.shared()
+        params = dict(self.params, form=form, keep=keep)
+        Run(infile, folder, base or base_name(infile), params, resume, self.cache, self.tables, self.engine, self.shards, pool, procs, cmd, update, self.queue, self.genes)
+
+    def annotate(self, sequences, form='nucl'):
+        '''
+        Annotations of a FASTA file or an iterable of (name, sequence) records.
+        The records, chunks and search results go to a temporary folder, in /dev/shm where
+        available, removed on return; the tables are built from the chunk results in memory
+        and no annotations/, database_hits/ or prodigal_results/ are written.
+        '''
+        temp = tempfile.mkdtemp(prefix='annoVIBRANT_', dir=TEMP) + '/'
+        try:
+            if isinstance(sequences, str):
+                infile = sequences
+            else:
+                infile = f'{temp}input.fasta'
+                with open(infile, 'w') as out:
+                    for name,seq in sequences:
+                        out.write(f'>{name}\n{seq}\n')
+            pool, procs = self.shared()
+            params = dict(self.params, form=form)
+            run = Run(infile, f'{temp}run/', 'input', params, False, self.cache, self.tables, self.engine, self.shards, pool, procs, None, False, self.queue, self.genes, memory=True)
+            return Annotations(run.annotations)
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    def run_batch(self, samples, form='nucl', keep=False, resume=False, update=False):
+        '''
+        Many samples, [(FASTA, output folder, sample name)] as from batch.samples(),
+        on their own pools. Returns the folders of the samples that failed.
+        '''
+        params = dict(self.params, form=form, keep=keep)
+        return batch.Batch(samples, params, resume, self.cache, self.tables, self.engine, self.shards, update, self.queue, self.genes).failed
+
+    def serve(self, path):
+        '''
+        Local annotation server on the Unix socket path until it is stopped.
+        Raises OSError if another server is listening on it.
+        '''
+        daemon.Server(path, self.params, self.cache, self.tables, self.engine, self.shards, self.queue, self.genes)
@@ -0,0 +1,142 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+import os
+import sqlite3
+import hashlib
+
+
+SOURCES = ['VIBRANT_names.tsv', 'VIBRANT_AMGs.tsv', 'VIBRANT_categories.tsv', 'VIBRANT_KEGG_pathways_summary.tsv']
+
+
+def cache_dir():
+    '''
+    Per-user folder for files derived from the databases and auxiliary files,
+    $XDG_CACHE_HOME/annoVIBRANT/ (~/.cache by default). Shared installs are never written.
+    '''
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'annoVIBRANT') + '/'
+
+def index_paths(aux):
+    '''
+    Index in the user cache, where it is built, then one already in the auxiliary folder.
+    '''
+    key = hashlib.md5(os.path.abspath(aux).encode()).hexdigest()
+    return [f'{cache_dir()}aux_{key}.sqlite', f'{aux}annoVIBRANT_index.sqlite']
+
+def source_stats(aux):
+    stats = []
+    for f in SOURCES:
+        s = os.stat(f'{aux}{f}')
+        stats.append((f, s.st_size, s.st_mtime_ns))
+    return stats
+
+def check_index(aux):
+    '''
+    Path of an index that matches the current source files (name, size, mtime), or None.
+    '''
+    try:
+        stats = source_stats(aux)
+    except FileNotFoundError:
+        return None
+    for path in index_paths(aux):
+        if not os.path.exists(path):
+            continue
+        try:
+            con = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                indexed = con.execute('SELECT file, size, mtime FROM sources ORDER BY rowid').fetchall()
+            finally:
+                con.close()
+        except sqlite3.Error:
+            continue
+        if indexed == stats:
+            return path
+    return None
+
+
+class AuxTables:
+    '''
+    VIBRANT auxiliary lookup tables, read once per run and shared read-only
+    with the annotation workers.
+    The first run parses the TSVs and saves them to a SQLite index, later runs load the index.
+    '''
+    def __init__(self, aux):
+        self.aux = aux
+
+        index = check_index(self.aux)
+        if index:
+            self.load_index(index)
+        else:
+            self.get_lists()
+            self.get_pathways()
+            self.build_index()
+
+    def get_lists(self):
+        with open(f'{self.aux}VIBRANT_names.tsv') as f:
+            items = f.read().replace('\n', '\t').split('\t')
+            self.names = {items[i]:items[i+1] for i in range(0,len(items),2)}
+            self.names.pop('', None)
+        
+        with open(f'{self.aux}VIBRANT_AMGs.tsv') as f:
+            next(f)
+            self.amgs = set(f.read().split('\n'))
+            self.amgs.discard('')
+
+        with open(f'{self.aux}VIBRANT_categories.tsv') as f:
+            next(f)
+            items = f.read().replace('\n', '\t').split('\t')
+            self.cats = {items[i]:(float(items[i+1])/100) for i in range(0,len(items),2)}
+            self.cats.pop('', None)
+
+    def get_pathways(self):
+        self.pathways = {}
+        with open(f'{self.aux}VIBRANT_KEGG_pathways_summary.tsv') as f:
+            items = f.read().split('\n')
+            for item in items:
+                if not item:
+                    continue
+                entry,meta,path,kos = item.split('\t')
+                kos = kos.split('~')
+                for k in kos:
+                    self.pathways.setdefault(k, []).append((entry,meta,path))
+            self.pathways.pop('', None)
+
+    def load_index(self, path):
+        con = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            self.names = dict(con.execute('SELECT acc, name FROM names'))
+            self.amgs = {k for k, in con.execute('SELECT ko FROM amgs')}
+            self.cats = dict(con.execute('SELECT acc, vscore FROM cats'))
+            self.pathways = {}
+            for ko,entry,meta,path in con.execute('SELECT ko, entry, meta, path FROM pathways ORDER BY rowid'):
+                self.pathways.setdefault(ko, []).append((entry,meta,path))
+        finally:
+            con.close()
+
+    def build_index(self):
+        '''
+        Written to a temp file and renamed so concurrent first runs never see a partial index.
+        Skipped quietly if the user cache is not writable.
+        '''
+        stats = source_stats(self.aux)
+        path = index_paths(self.aux)[0]
+        temp = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            con = sqlite3.connect(temp)
+            with con:
+                con.execute('CREATE TABLE sources (file TEXT, size INTEGER, mtime INTEGER)')
+                con.execute('CREATE TABLE names (acc TEXT, name TEXT)')
+                con.execute('CREATE TABLE amgs (ko TEXT)')
+                con.execute('CREATE TABLE cats (acc TEXT, vscore REAL)')
+                con.execute('CREATE TABLE pathways (ko TEXT, entry TEXT, meta TEXT, path TEXT)')
+                con.executemany('INSERT INTO sources VALUES (?, ?, ?)', stats)
+                con.executemany('INSERT INTO names VALUES (?, ?)', self.names.items())
+                con.executemany('INSERT INTO amgs VALUES (?)', [(k,) for k in self.amgs])
+                con.executemany('INSERT INTO cats VALUES (?, ?)', self.cats.items())
+                con.executemany('INSERT INTO pathways VALUES (?, ?, ?, ?)', [(k,) + p for k,paths in self.pathways.items() for p in paths])
+            con.close()
+            os.replace(temp, path)
+        except (OSError, sqlite3.Error):
+            if os.path.exists(temp):
+                os.remove(temp)
@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scripts.pipeline import pools
+from scripts.run import Run, RunError, RunComplete, base_name
+
+
+FASTA = ('.fna', '.fa', '.fasta', '.fas', '.fsa', '.faa', '.ffn')
+
+
+def samples(path, outdir):
+    '''
+    (input, output folder, sample name) for each FASTA of a directory, or each line of a
+    sample sheet: input FASTA, optionally a tab and its output folder.
+    The default output folder is annoVIBRANT_results_<sample>/ in outdir.
+    '''
+    found = []
+    if os.path.isdir(path):
+        path = path.rstrip('/') + '/'
+        for f in sorted(os.listdir(path)):
+            if f.endswith(FASTA):
+                found.append((f'{path}{f}', ''))
+    else:
+        with open(path) as sheet:
+            for line in sheet:
+                line = line.strip('\n').split('\t')
+                if line[0] and line[0][0] != '#':
+                    found.append((line[0], line[1] if len(line) > 1 else ''))
+    runs = []
+    for infile,folder in found:
+        base = base_name(infile)
+        folder = folder or f'{outdir}annoVIBRANT_results_{base}/'
+        if folder[-1] != '/':
+            folder += '/'
+        runs.append((infile, folder, base))
+    return runs
+
+
+class Batch:
+    '''
+    Many samples on one thread pool and one process pool. Up to 2 x threads samples
+    are in flight at a time, largest first; their chunk jobs share one queue, so chunks
+    of small samples fill threads left idle by large ones and the databases stay in page cache.
+    Each sample gets the output folder of a single run. A failed sample does not stop the others.
+    With resume or update, samples without an output folder yet are started fresh.
+    '''
+    def __init__(self, samples, params, resume=False, cache=None, tables=None, engine=None, shards=None, update=False, queue=None, gene_cache=None):
+        self.failed = []
+        samples = sorted(samples, key=lambda s: os.path.getsize(s[0]), reverse=True)
+        pool, procs = pools(params['threads'], tables)
+        try:
+            with ThreadPoolExecutor(2 * params['threads']) as runs:
+                futures = {runs.submit(Run, infile, folder, base, params, resume and os.path.exists(folder), cache, tables, engine, shards, pool, procs, None, update and os.path.exists(folder), queue, gene_cache): folder for infile,folder,base in samples}
+                for future in as_completed(futures):
+                    self.report(futures[future], future)
+        finally:
+            procs.shutdown()
+
+    def report(self, folder, future):
+        try:
+            future.result()
+            print(f'Done: {folder}', flush=True)
+        except RunComplete:
+            print(f'Already complete: {folder}', flush=True)
+        except RunError as e:
+            self.failed.append(folder)
+            print(f'Failed: {folder}: {e}', flush=True)
+        except Exception:
+            self.failed.append(folder)
+            print(f'Failed: {folder}\n{traceback.format_exc()}', flush=True)
@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import heapq
+
+
+def chunk_base(f):
+    '''
+    Split files are named <chunk number>.<ext>, ie 12.faa or 12.KEGG.temp.
+    '''
+    return f.rsplit('/',1)[-1].split('.',1)[0]
+
+def chunk_files(folder, ext):
+    files = [f for f in os.listdir(folder) if chunk_base(f).isdigit() and f == chunk_base(f) + ext]
+    files.sort(key=lambda f: int(chunk_base(f)))
+    return [f'{folder}{f}' for f in files]
+
+def partition(sizes, bins):
+    '''
+    Greedy longest-first bin packing: each item goes to the currently lightest bin.
+    Returns the bin (0 based) of each item in input order.
+    '''
+    heap = [(0, b) for b in range(bins)]
+    assign = [0] * len(sizes)
+    for i in sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True):
+        load,b = heapq.heappop(heap)
+        assign[i] = b
+        heapq.heappush(heap, (load + sizes[i], b))
+    return assign
+
+def distribute(records, counts, bins, folder, ext):
+    '''
+    Second pass of a split: (name, seq) records in input order, the next counts[i] of them
+    going to chunk <bins[i]+1>.<ext>. Only one record is held at a time.
+    '''
+    units = zip(counts, bins)
+    left = 0
+    handles = {}
+    try:
+        for name,seq in records:
+            while not left:
+                left,b = next(units)
+            out = handles.get(b)
+            if not out:
+                out = open(f'{folder}{b+1}{ext}', 'w', buffering=1048576)
+                handles[b] = out
+            out.write(f'>{name}\n{seq}\n')
+            left -= 1
+    finally:
+        for out in handles.values():
+            out.close()
@@ -2,120 +2,215 @@
 # Author: Kristopher Kieft
 # University of Wisconsin-Madison
 
-import subprocess
 import os
-import pandas as pd
+import shutil
 from collections import Counter
+from scripts.chunks import chunk_files
+from scripts.aux_tables import AuxTables
+from scripts.profiler import Profiler
+from scripts.databases import VIBRANT, header
+
+
+BEST_HEADER = 'protein\tscaffold\taccession\tname\tevalue\tscore\n'
+AMG_HEADER = 'protein\tscaffold\tKO\tKO name\tevalue\tscore\n'
+COUNTS_HEADER = 'AMG count\tAMG KO\tAMG KO name\n'
+PATHWAYS_HEADER = 'KEGG Entry\tMetabolism\tPathway\tTotal AMGs\tAMG KO\n'
+
+
+def kernel_copy(infile, out):
+    '''
+    Append infile to out without passing the bytes through Python:
+    copy_file_range, else sendfile, else a plain buffered copy.
+    '''
+    out.flush()
+    copies = (lambda i,o: os.copy_file_range(i, o, 1073741824),
+              lambda i,o: os.sendfile(o, i, None, 1073741824))
+    for copy in copies:
+        try:
+            while copy(infile.fileno(), out.fileno()):
+                pass
+            return
+        except (AttributeError, OSError):
+            continue # not available for this platform or file system, carry on from the same offsets
+    shutil.copyfileobj(infile, out)
+
+def replace_copy(infile, out):
+    '''
+    Append infile to out replacing the $~& space placeholder in 1 MB blocks.
+    Blocks are cut at the last newline so a placeholder is never split.
+    '''
+    carry = b''
+    while True:
+        block = infile.read(1048576)
+        if not block:
+            break
+        block = carry + block
+        cut = block.rfind(b'\n') + 1
+        out.write(block[:cut].replace(b'$~&', b' '))
+        carry = block[cut:]
+    out.write(carry.replace(b'$~&', b' '))
+
+def count_copy(infile, out, counts):
+    '''
+    Append AMG rows to out while counting their KO column.
+    '''
+    for line in infile:
+        out.write(line)
+        counts[line.split(b'\t',3)[2].decode()] += 1
+
+def concat(files, outfile, header='', replace=False, counts=None):
+    with open(outfile, 'wb') as out:
+        out.write(header.encode())
+        for f in files:
+            with open(f, 'rb') as infile:
+                if counts is not None:
+                    count_copy(infile, out, counts)
+                elif replace:
+                    replace_copy(infile, out)
+                else:
+                    kernel_copy(infile, out)
+
+def read_rows(files):
+    rows = []
+    for f in files:
+        with open(f) as infile:
+            rows += [line.rstrip('\n').split('\t') for line in infile]
+    return rows
+
+def amg_summary(counts, tables):
+    '''
+    Rows of the AMG count and pathway tables for a KO Counter.
+    '''
+    count_rows = []
+    path_rows = []
+    for val,count in counts.most_common():
+        name = tables.names.get(val, 'hypothetical protein')
+        paths = tables.pathways.get(val, [(None,None,None)])
+        count_rows.append([str(count), val, name])
+        for p in paths:
+            path_rows.append([str(p[0]), str(p[1]), str(p[2]), str(count), val])
+    return count_rows, path_rows
+
+def amg_counts(path):
+    '''
+    KO counts of an existing VIBRANT_AMG_individuals table.
+    '''
+    counts = Counter()
+    with open(path) as f:
+        next(f)
+        for line in f:
+            counts[line.split('\t',3)[2]] += 1
+    return counts
+
+def summarize_AMGs(samples, tables):
+    '''
+    Write the AMG count and pathway tables for any number of samples in one call.
+    samples: iterable of (annotations folder, base, KO Counter or None to count the AMG individuals table)
+    '''
+    for folder,base,counts in samples:
+        if counts is None:
+            counts = amg_counts(f'{folder}VIBRANT_AMG_individuals_{base}.tsv')
+        count_rows, path_rows = amg_summary(counts, tables)
+        with open(f'{folder}VIBRANT_AMG_counts_{base}.tsv', 'w') as amgcounts, open(f'{folder}VIBRANT_AMG_pathways_{base}.tsv', 'w') as amgpaths:
+            amgcounts.write(COUNTS_HEADER)
+            amgpaths.write(PATHWAYS_HEADER)
+            amgcounts.writelines('\t'.join(row) + '\n' for row in count_rows)
+            amgpaths.writelines('\t'.join(row) + '\n' for row in path_rows)
+
 
 class CombineClean:
-    def __init__(self, folder, base, aux, form):
+    '''
+    databases: the registry of the run, the VIBRANT databases by default.
+    The best hits of each database go to database_hits/<sample>.<db>.tsv for --update.
+    hmms: databases whose full hits are combined with keep, all by default.
+    With memory the tables are built in memory, {table: (columns, rows)} in annotations,
+    and nothing but the chunk results is read or written (no annotations/, database_hits/
+    or prodigal_results/).
+    '''
+    def __init__(self, folder, base, aux, form, keep=False, tables=None, profile=None, databases=None, hmms=None, memory=False):
         self.folder = folder
         self.base = base
         self.aux = aux
-
+        self.databases = databases or [[name, hmm, col, ''] for name,hmm,col in VIBRANT]
+        self.hmms = hmms if hmms is not None else [name for name,_,_,_ in self.databases]
+        self.tables = tables
+        if not self.tables:
+            self.tables = AuxTables(self.aux)
+        profile = profile or Profiler()
+
+        with profile.job('merge', inputs=self.inputs()):
+            if memory:
+                self.collect_annotations()
+            else:
+                self.write_annotations(form, keep)
+        with profile.job('cleanup'):
+            self.cleanup()
+
+    def write_annotations(self, form, keep):
         self.combine_annotations()
         self.summarize_AMGs()
+        self.store_hits()
         if form == 'nucl':
             self.combine_prodigal()
-        self.combine_hmms()
-        self.cleanup()
+        if keep:
+            self.combine_hmms()
+
+    def inputs(self):
+        files = []
+        for temp in ('annotations_temp', 'raw_hmm_results'):
+            if os.path.exists(f'{self.folder}{temp}/'):
+                files += [f'{self.folder}{temp}/{f}' for f in os.listdir(f'{self.folder}{temp}/')]
+        return files
 
 
     def summarize_AMGs(self):
-        with open(f'{self.aux}VIBRANT_names.tsv') as f:
-            items = f.read().replace('\n', '\t').split('\t')
-            names = {items[i]:items[i+1] for i in range(0,len(items),2) if items[i][0] == 'K'}
-        
-
-        pathways = {}
-        with open(f'{self.aux}VIBRANT_KEGG_pathways_summary.tsv') as f:
-            items = f.read().split('\n')
-            for item in items:
-                entry,meta,path,kos = item.split('\t')
-                kos = kos.split('~')
-                for k in kos:
-                    pathways.setdefault(k, []).append((entry,meta,path))
-            pathways.pop('', None)
-
-        df = pd.read_table(f'{self.folder}annotations/VIBRANT_AMG_individuals_{self.base}.tsv')
-        ko = df['KO'].tolist()
-        counts = list(Counter(ko).items())
-        counts.sort(key=lambda x: x[1], reverse=True)
-
-        with open(f'{self.folder}annotations/VIBRANT_AMG_counts_{self.base}.tsv', 'w') as amgcounts, open(f'{self.folder}annotations/VIBRANT_AMG_pathways_{self.base}.tsv', 'w') as amgpaths:
-            amgcounts.write('AMG count\tAMG KO\tAMG KO name\n')
-            amgpaths.write('KEGG Entry\tMetabolism\tPathway\tTotal AMGs\tAMG KO\n')
-            for item in counts:
-                val,count = item
-                name = names.get(val, 'hypothetical protein')
-                paths = pathways.get(val, [(None,None,None)])
-                amgcounts.write(f'{count}\t{val}\t{name}\n')
-                for p in paths:
-                    amgpaths.write(f'{p[0]}\t{p[1]}\t{p[2]}\t{count}\t{val}\n')
+        summarize_AMGs([(f'{self.folder}annotations/', self.base, self.counts)], self.tables)
 
     def combine_annotations(self):
-        os.mkdir(f'{self.folder}annotations/')
-        files = os.listdir(f'{self.folder}annotations_temp/')
-        amgs = ' '.join([f'{self.folder}annotations_temp/{f}' for f in files if f[1:] == '.amgs.tsv'])
-        best = ' '.join([f'{self.folder}annotations_temp/{f}' for f in files if f[1:] == '.best.tsv'])
-        full = ' '.join([f'{self.folder}annotations_temp/{f}' for f in files if f[1:] == '.full.tsv'])
-
-        with open(f'{self.folder}annotations/VIBRANT_full_annotations_{self.base}.tsv', 'w') as f:
-            f.write('protein\tscaffold\tKO\tAMG\tKO name\tKO evalue\tKO score\tKO v-score\tPfam\tPfam name\tPfam evalue\tPfam score\tPfam v-score\tVOG\tVOG name\tVOG evalue\tVOG score\tVOG v-score\n')
-        with open(f'{self.folder}annotations/VIBRANT_best_annotations_{self.base}.tsv', 'w') as f:
-            f.write('protein\tscaffold\taccession\tname\tevalue\tscore\n')
-        with open(f'{self.folder}annotations/VIBRANT_AMG_individuals_{self.base}.tsv', 'w') as f:
-            f.write('protein\tscaffold\tKO\tKO name\tevalue\tscore\n')
-        
-        s1 = subprocess.Popen(f'cat {full} >> {self.folder}annotations/VIBRANT_full_annotations_{self.base}.tsv 2> /dev/null', shell=True)
-        s2 = subprocess.Popen(f'cat {best} >> {self.folder}annotations/VIBRANT_best_annotations_{self.base}.tsv 2> /dev/null', shell=True)
-        s3 = subprocess.Popen(f'cat {amgs} >> {self.folder}annotations/VIBRANT_AMG_individuals_{self.base}.tsv 2> /dev/null', shell=True)
-        s1.wait()
-        s2.wait()
-        s3.wait()
+        os.makedirs(f'{self.folder}annotations/', exist_ok=True)
+        amgs = chunk_files(f'{self.folder}annotations_temp/', '.amgs.tsv')
+        best = chunk_files(f'{self.folder}annotations_temp/', '.best.tsv')
+        full = chunk_files(f'{self.folder}annotations_temp/', '.full.tsv')
+
+        concat(full, f'{self.folder}annotations/VIBRANT_full_annotations_{self.base}.tsv', header(self.databases))
+        concat(best, f'{self.folder}annotations/VIBRANT_best_annotations_{self.base}.tsv', BEST_HEADER)
+        self.counts = Counter()
+        concat(amgs, f'{self.folder}annotations/VIBRANT_AMG_individuals_{self.base}.tsv', AMG_HEADER, counts=self.counts)
+
+    def collect_annotations(self):
+        columns = lambda h: h.rstrip('\n').split('\t')
+        amgs = read_rows(chunk_files(f'{self.folder}annotations_temp/', '.amgs.tsv'))
+        count_rows, path_rows = amg_summary(Counter(row[2] for row in amgs), self.tables)
+        self.annotations = {
+            'full': (columns(header(self.databases)), read_rows(chunk_files(f'{self.folder}annotations_temp/', '.full.tsv'))),
+            'best': (columns(BEST_HEADER), read_rows(chunk_files(f'{self.folder}annotations_temp/', '.best.tsv'))),
+            'amg': (columns(AMG_HEADER), amgs),
+            'amg_counts': (columns(COUNTS_HEADER), count_rows),
+            'amg_pathways': (columns(PATHWAYS_HEADER), path_rows)}
+
+    def store_hits(self):
+        os.makedirs(f'{self.folder}database_hits/', exist_ok=True)
+        for name,_,_,_ in self.databases:
+            files = chunk_files(f'{self.folder}parsed_hmm_results/', f'.{name}.tsv') + chunk_files(f'{self.folder}parsed_hmm_results/', f'.{name}.cached.tsv')
+            with open(f'{self.folder}database_hits/{self.base}.{name}.tsv', 'wb') as out:
+                out.write(b'protein\taccession\tevalue\tscore\n')
+                for f in files:
+                    with open(f, 'rb') as infile:
+                        infile.readline() # header
+                        replace_copy(infile, out)
 
     def combine_prodigal(self):
-        os.mkdir(f'{self.folder}prodigal_results/')
-        files = os.listdir(f'{self.folder}split_files/')
-        faa = ' '.join([f'{self.folder}split_files/{f}' for f in files if f[-4:] == '.faa'])
-        ffn = ' '.join([f'{self.folder}split_files/{f}' for f in files if f[-4:] == '.ffn'])
-        gff = ' '.join([f'{self.folder}split_files/{f}' for f in files if f[-4:] == '.gff'])
-        
-
-        s1 = subprocess.Popen(f'cat {faa} | sed "s/\$\~\&/ /g" > {self.folder}prodigal_results/{self.base}.prodigal.faa 2> /dev/null', shell=True)
-        s2 = subprocess.Popen(f'cat {ffn} | sed "s/\$\~\&/ /g" > {self.folder}prodigal_results/{self.base}.prodigal.ffn 2> /dev/null', shell=True)
-        s3 = subprocess.Popen(f'cat {gff} | sed "s/\$\~\&/ /g" > {self.folder}prodigal_results/{self.base}.prodigal.gff 2> /dev/null', shell=True)
-        s1.wait()
-        s2.wait()
-        s3.wait()
+        os.makedirs(f'{self.folder}prodigal_results/', exist_ok=True)
+        for ext in ('faa', 'ffn', 'gff'):
+            files = chunk_files(f'{self.folder}split_files/', f'.{ext}')
+            concat(files, f'{self.folder}prodigal_results/{self.base}.prodigal.{ext}', replace=True)
 
     def combine_hmms(self):
-        os.mkdir(f'{self.folder}full_hmmsearch_results/')
-        files = os.listdir(f'{self.folder}raw_hmm_results/')
-        kegg = ' '.join([f'{self.folder}raw_hmm_results/{f}' for f in files if f[1:] == '.KEGG.hmmtbl'])
-        pfam = ' '.join([f'{self.folder}raw_hmm_results/{f}' for f in files if f[1:] == '.Pfam.hmmtbl'])
-        vog = ' '.join([f'{self.folder}raw_hmm_results/{f}' for f in files if f[1:] == '.VOG.hmmtbl'])
-
-        with open(f'{self.folder}full_hmmsearch_results/{self.base}.KEGG.hmmtbl', 'w') as f:
-            f.write('protein\taccession\tevalue\tscore\n')
-        with open(f'{self.folder}full_hmmsearch_results/{self.base}.Pfam.hmmtbl', 'w') as f:
-            f.write('protein\taccession\tevalue\tscore\n')
-        with open(f'{self.folder}full_hmmsearch_results/{self.base}.VOG.hmmtbl', 'w') as f:
-            f.write('protein\taccession\tevalue\tscore\n')
-
-        s1 = subprocess.Popen(f'cat {kegg} | sed "s/\$\~\&/ /g" >> {self.folder}full_hmmsearch_results/{self.base}.KEGG.hmmtbl 2> /dev/null', shell=True)
-        s2 = subprocess.Popen(f'cat {pfam} | sed "s/\$\~\&/ /g" >> {self.folder}full_hmmsearch_results/{self.base}.Pfam.hmmtbl 2> /dev/null', shell=True)
-        s3 = subprocess.Popen(f'cat {vog} | sed "s/\$\~\&/ /g" >> {self.folder}full_hmmsearch_results/{self.base}.VOG.hmmtbl 2> /dev/null', shell=True)
-        s1.wait()
-        s2.wait()
-        s3.wait()
+        os.makedirs(f'{self.folder}full_hmmsearch_results/', exist_ok=True)
+        for name in self.hmms:
+            files = chunk_files(f'{self.folder}raw_hmm_results/', f'.{name}.hmmtbl')
+            concat(files, f'{self.folder}full_hmmsearch_results/{self.base}.{name}.hmmtbl', 'protein\taccession\tevalue\tscore\n', replace=True)
 
     def cleanup(self):
-        s1 = subprocess.Popen(f'rm -R {self.folder}split_files/ 2> /dev/null', shell=True)
-        s2 = subprocess.Popen(f'rm -R {self.folder}annotations_temp/ 2> /dev/null', shell=True)
-        s3 = subprocess.Popen(f'rm -R {self.folder}parsed_hmm_results/ 2> /dev/null', shell=True)
-        s4 = subprocess.Popen(f'rm -R {self.folder}raw_hmm_results/ 2> /dev/null', shell=True)
-        s1.wait()
-        s2.wait()
-        s3.wait()
-        s4.wait()
\ No newline at end of file
+        for temp in ('split_files', 'annotations_temp', 'parsed_hmm_results', 'raw_hmm_results'):
+            shutil.rmtree(f'{self.folder}{temp}/', ignore_errors=True)
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import sys
+import json
+import signal
+import socket
+import struct
+import traceback
+import socketserver
+from scripts.pipeline import pools
+from scripts.run import Run, RunError
+
+
+def submit(path, job):
+    '''
+    Send one job to the server on socket path and wait for its reply.
+    job: input, folder, base, form, keep, resume, update, command
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall((json.dumps(job) + '\n').encode())
+        with s.makefile() as f:
+            return json.loads(f.readline())
+
+def alive(path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(path)
+        return True
+    except OSError:
+        return False
+
+def peer_uid(sock):
+    '''
+    User of the client on a Unix socket, where the platform tells (SO_PEERCRED on Linux).
+    '''
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return os.getuid()
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+class Handler(socketserver.StreamRequestHandler):
+    '''
+    One JSON line in, one JSON line out: {"status": "ok"|"error", "folder", "message"}.
+    Jobs of other users are refused: they would read and write as the server's user.
+    '''
+    def handle(self):
+        line = self.rfile.readline()
+        if not line: # liveness check
+            return
+        job = json.loads(line)
+        if peer_uid(self.request) != os.getuid():
+            reply = {'status': 'error', 'folder': job.get('folder', ''), 'message': 'The annotation server only runs jobs of the user running it.'}
+        else:
+            reply = self.server.annotator.job(job)
+        self.wfile.write((json.dumps(reply) + '\n').encode())
+
+
+class Server:
+    '''
+    Long-running local annotation server on a Unix socket.
+    The auxiliary tables, search engine, HMM shards, hit and gene caches are loaded and the
+    thread and process pools started once; every job is a Run on the shared pools,
+    so jobs run side by side and each chunk search queues with all the others.
+    Score, databases, threads and engine are those of the server, form and --keep-hits are per job.
+    Jobs read their input and write their folder as the user running the server, so the socket
+    is only open to that user (mode 0600) and jobs from other users are refused.
+    Raises OSError if another server is listening on path.
+    '''
+    def __init__(self, path, params, cache=None, tables=None, engine=None, shards=None, queue=None, gene_cache=None):
+        self.params = params
+        self.cache = cache
+        self.tables = tables
+        self.engine = engine
+        self.shards = shards
+        self.queue = queue
+        self.gene_cache = gene_cache
+        if alive(path):
+            raise OSError(f'A server is already listening on {path}.')
+        if os.path.exists(path):
+            os.remove(path) # left over from a server that was killed
+
+        self.pool, self.procs = pools(params['threads'], self.tables)
+        umask = os.umask(0o177) # created 0600, no run writes files yet
+        try:
+            server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        finally:
+            os.umask(umask)
+        with server:
+            server.daemon_threads = True
+            server.annotator = self
+            print(f'{params["program"]} listening on {path}', flush=True)
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(path)
+                self.procs.shutdown()
+
+    def job(self, job):
+        params = dict(self.params, form=job['form'], keep=job['keep'])
+        try:
+            Run(job['input'], job['folder'], job['base'], params, job['resume'], self.cache, self.tables, self.engine, self.shards, self.pool, self.procs, job['command'], job.get('update', False), self.queue, self.gene_cache)
+        except RunError as e:
+            return {'status': 'error', 'folder': job['folder'], 'message': str(e)}
+        except Exception:
+            return {'status': 'error', 'folder': job['folder'], 'message': traceback.format_exc()}
+        return {'status': 'ok', 'folder': job['folder'], 'message': ''}
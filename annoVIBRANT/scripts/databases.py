@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import re
+
+
+# (name, HMM file in the VIBRANT database folder, tblout column holding the annotation)
+VIBRANT = [('KEGG', 'KEGG_profiles_prokaryotes.HMM', 2),
+           ('Pfam', 'Pfam-A_v32.HMM', 3),
+           ('VOG', 'VOGDB94_phage.HMM', 2)]
+COLUMNS = {'name': 2, 'accession': 3}
+AMG = 'KEGG' # database whose accessions are looked up in VIBRANT_AMGs.tsv
+LABELS = {'KEGG': 'KO'} # column prefix in the full annotations table, the name otherwise
+
+
+def registry(db, names='KEGG,Pfam,VOG', extra=()):
+    '''
+    [name, HMM path, tblout column, score threshold] of every database to search, in order:
+    the VIBRANT databases of db that are named, then the extra ones. The threshold is
+    '' for the run's -s. Lists, not tuples, so it is stored as is in the run manifest.
+    extra: 'name,path[,name|accession[,score]]' strings of other pressed HMM databases.
+    Raises ValueError for unknown, duplicate or unusable names.
+    '''
+    known = {name: (hmm, col) for name,hmm,col in VIBRANT}
+    databases = []
+    for name in names.split(','):
+        if name not in known:
+            raise ValueError(f'Unknown VIBRANT database "{name}", choose from {", ".join(known)}.')
+        databases.append([name, f'{db}{known[name][0]}', known[name][1], ''])
+    for spec in extra:
+        spec = spec.split(',')
+        if len(spec) < 2 or len(spec) > 4 or (len(spec) > 2 and spec[2] not in COLUMNS):
+            raise ValueError(f'Extra database "{",".join(spec)}" should be name,path[,name|accession[,score]].')
+        col = COLUMNS[spec[2]] if len(spec) > 2 else 2
+        databases.append([spec[0], os.path.abspath(spec[1]), col, spec[3] if len(spec) > 3 else ''])
+    found = set()
+    for name,_,_,_ in databases:
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', name) or name == 'uniq': # used in chunk file names
+            raise ValueError(f'Database name "{name}" may only use letters, digits, _ and - (and not be "uniq").')
+        if name in found:
+            raise ValueError(f'Database "{name}" is given twice.')
+        found.add(name)
+    return databases
+
+def header(databases):
+    '''
+    Column names of the full annotations table.
+    '''
+    columns = ['protein', 'scaffold']
+    for name,_,_,_ in databases:
+        label = LABELS.get(name, name)
+        columns.append(label)
+        if name == AMG:
+            columns.append('AMG')
+        columns += [f'{label} name', f'{label} evalue', f'{label} score', f'{label} v-score']
+    return '\t'.join(columns) + '\n'
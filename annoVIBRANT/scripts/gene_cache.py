@@ -0,0 +1,135 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import re
+import time
+import sqlite3
+import hashlib
+import subprocess
+
+
+NAME = '\x00' # placeholders in stored calls for the scaffold name
+SEQNUM = '\x01' # and its position in the chunk, the first part of Prodigal IDs
+ID = re.compile(r' # ID=(\d+)_')
+
+
+def scaffold_digest(seq):
+    '''
+    Scaffold identity for the cache: the sequence as given (case and Ns change the calls).
+    '''
+    return hashlib.sha1(seq.replace('\n', '').encode()).hexdigest()
+
+def prodigal_version():
+    '''
+    Calls are only reused from the same Prodigal.
+    '''
+    try:
+        p = subprocess.run('prodigal -v', shell=True, capture_output=True, text=True)
+    except OSError:
+        return ''
+    return (p.stdout + p.stderr).strip() if p.returncode == 0 else ''
+
+def fasta_sections(path, names):
+    '''
+    Prodigal .faa or .ffn records by scaffold position (from the ID), as templates.
+    '''
+    sections = {}
+    seqnum = None
+    with open(path) as f:
+        for line in f:
+            if line[0] == '>':
+                seqnum = int(ID.search(line).group(1))
+                name = names[seqnum-1]
+                line = f'>{NAME}{line[1+len(name):]}'.replace(f' # ID={seqnum}_', f' # ID={SEQNUM}_', 1)
+            sections.setdefault(seqnum, []).append(line)
+    return {k: ''.join(v) for k,v in sections.items()}
+
+def gff_sections(path, names):
+    '''
+    Prodigal .gff lines by scaffold position, from its Sequence Data line on, as templates.
+    '''
+    sections = {}
+    seqnum = None
+    with open(path) as f:
+        for line in f:
+            if line.startswith('# Sequence Data: seqnum='):
+                seqnum = int(line[24:].split(';',1)[0])
+                name = names[seqnum-1]
+                line = f'# Sequence Data: seqnum={SEQNUM};' + line.split(';',1)[1].replace(f'seqhdr="{name}"', f'seqhdr="{NAME}"')
+            elif seqnum is None:
+                continue # ##gff-version
+            elif line[0] != '#':
+                name = names[seqnum-1]
+                line = NAME + line[len(name):].replace(f'\tID={seqnum}_', f'\tID={SEQNUM}_', 1)
+            sections.setdefault(seqnum, []).append(line)
+    return {k: ''.join(v) for k,v in sections.items()}
+
+def calls(prefix, names):
+    '''
+    Templates (faa, ffn, gff) of each scaffold Prodigal called in <prefix>.faa/.ffn/.gff,
+    in the order of names; scaffolds without genes have a gff section only.
+    '''
+    faa = fasta_sections(f'{prefix}.faa', names)
+    ffn = fasta_sections(f'{prefix}.ffn', names)
+    gff = gff_sections(f'{prefix}.gff', names)
+    return [(faa.get(k, ''), ffn.get(k, ''), gff.get(k, '')) for k in range(1, len(names)+1)]
+
+def fill(template, name, seqnum):
+    return template.replace(NAME, name).replace(SEQNUM, str(seqnum))
+
+
+class GeneCache:
+    '''
+    On-disk Prodigal calls per (scaffold digest, Prodigal version), shared across runs.
+    In -p meta mode the calls of a scaffold depend on its sequence only, so they are
+    stored without the scaffold name and position and filled in for each run.
+    SQLite in WAL mode handles several runs using the same cache file, as the hit cache,
+    and the size is checked as there, once 1% of max_entries were added.
+    '''
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.added = 0
+        self.version = prodigal_version()
+        with self.connect() as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('CREATE TABLE IF NOT EXISTS genes (digest TEXT, version TEXT, faa TEXT, ffn TEXT, gff TEXT, used REAL, PRIMARY KEY (digest, version))')
+            con.execute('CREATE INDEX IF NOT EXISTS genes_used ON genes (used)')
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=600)
+
+    def lookup(self, digests):
+        '''
+        Returns {digest: (faa, ffn, gff)} for cached scaffolds and marks them as used.
+        '''
+        digests = list(digests)
+        found = {}
+        with self.connect() as con:
+            for i in range(0, len(digests), 500):
+                batch = digests[i:i+500]
+                marks = ','.join('?' * len(batch))
+                rows = con.execute(f'SELECT digest, faa, ffn, gff FROM genes WHERE version = ? AND digest IN ({marks})', [self.version] + batch)
+                for d,faa,ffn,gff in rows:
+                    found[d] = (faa, ffn, gff)
+            now = time.time()
+            con.executemany('UPDATE genes SET used = ? WHERE digest = ? AND version = ?', [(now, d, self.version) for d in found])
+        return found
+
+    def store(self, genes):
+        '''
+        genes: iterable of (digest, faa, ffn, gff) templates.
+        Least recently used entries are evicted beyond max_entries.
+        '''
+        now = time.time()
+        rows = [(d, self.version, faa, ffn, gff, now) for d,faa,ffn,gff in genes]
+        with self.connect() as con:
+            con.executemany('INSERT OR REPLACE INTO genes VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.added += len(rows)
+            if self.added < max(1, self.max_entries // 100):
+                return
+            self.added = 0
+            extra = con.execute('SELECT COUNT(*) FROM genes').fetchone()[0] - self.max_entries
+            if extra > 0:
+                con.execute('DELETE FROM genes WHERE rowid IN (SELECT rowid FROM genes ORDER BY used LIMIT ?)', (extra,))
@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import time
+import sqlite3
+import hashlib
+
+
+def digest(seq):
+    '''
+    Protein identity for the cache: residues only, no line breaks or stop codon.
+    '''
+    return hashlib.sha1(seq.replace('\n', '').rstrip('*').upper().encode()).hexdigest()
+
+def rescale(evalue, z, to):
+    '''
+    E-value of a search of z sequences as if to sequences were searched: E-values scale
+    with Z, bit scores do not. Formatted as in a hmmsearch tblout.
+    '''
+    if not evalue or z == to:
+        return evalue
+    return f'{float(evalue) * to / z:.2g}'
+
+
+class HitCache:
+    '''
+    On-disk best hit per (protein digest, database, score threshold), shared across runs.
+    An empty accession records that the protein was searched and had no hit.
+    The E-value is stored with the Z (chunk size) of its search and rescaled to the Z of
+    the chunk looking it up, so cached hits match a fresh search of that chunk.
+    SQLite in WAL mode handles several runs using the same cache file.
+    The size is checked once 1% of max_entries were added, not on every store (a full count).
+    '''
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.added = 0
+        with self.connect() as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            columns = [row[1] for row in con.execute('PRAGMA table_info(hits)')]
+            if columns and 'z' not in columns: # E-values of unknown Z cannot be rescaled
+                con.execute('DROP TABLE hits')
+            con.execute('CREATE TABLE IF NOT EXISTS hits (digest TEXT, db TEXT, score TEXT, accession TEXT, evalue TEXT, bitscore TEXT, z INTEGER, used REAL, PRIMARY KEY (digest, db, score))')
+            con.execute('CREATE INDEX IF NOT EXISTS hits_used ON hits (used)')
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=600)
+
+    def lookup(self, db, score, digests, z):
+        '''
+        Returns {digest: (accession, evalue, bitscore)} for cached proteins, E-values for
+        a chunk of z proteins, and marks them as used.
+        '''
+        digests = list(digests)
+        found = {}
+        with self.connect() as con:
+            for i in range(0, len(digests), 500):
+                batch = digests[i:i+500]
+                marks = ','.join('?' * len(batch))
+                rows = con.execute(f'SELECT digest, accession, evalue, bitscore, z FROM hits WHERE db = ? AND score = ? AND digest IN ({marks})', [db, score] + batch)
+                for d,acc,evalue,bitscore,searched in rows:
+                    found[d] = (acc, rescale(evalue, searched, z), bitscore)
+            now = time.time()
+            con.executemany('UPDATE hits SET used = ? WHERE digest = ? AND db = ? AND score = ?', [(now, d, db, score) for d in found])
+        return found
+
+    def store(self, db, score, hits, z):
+        '''
+        hits: iterable of (digest, accession, evalue, bitscore); accession is '' for no hit.
+        z: the Z the E-values were computed with.
+        Least recently used entries are evicted beyond max_entries.
+        '''
+        now = time.time()
+        rows = [(d, db, score, acc, evalue, bitscore, z, now) for d,acc,evalue,bitscore in hits]
+        with self.connect() as con:
+            con.executemany('INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.added += len(rows)
+            if self.added < max(1, self.max_entries // 100):
+                return
+            self.added = 0
+            extra = con.execute('SELECT COUNT(*) FROM hits').fetchone()[0] - self.max_entries
+            if extra > 0:
+                con.execute('DELETE FROM hits WHERE rowid IN (SELECT rowid FROM hits ORDER BY used LIMIT ?)', (extra,))
@@ -0,0 +1,64 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import threading
+try:
+    import pyhmmer
+except ImportError:
+    pyhmmer = None
+
+
+ENGINES = ('hmmsearch', 'pyhmmer')
+
+
+def text(name):
+    '''
+    pyhmmer < 0.11 returns names as bytes.
+    '''
+    if isinstance(name, bytes):
+        return name.decode()
+    return name
+
+
+class PyHMMER:
+    '''
+    In-process hmmsearch. Each pressed database is loaded once and shared by every
+    search job; jobs run on the pool threads since pyhmmer releases the GIL.
+    Profiles are copied per search because pyhmmer reconfigures them to the target length.
+    '''
+    def __init__(self, score):
+        self.score = float(score)
+        self.alphabet = pyhmmer.easel.Alphabet.amino()
+        self.profiles = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def load(self, hmm):
+        with self.lock:
+            lock = self.locks.setdefault(hmm, threading.Lock())
+        with lock: # other databases keep loading while this one is read
+            if hmm not in self.profiles:
+                with pyhmmer.plan7.HMMFile(hmm) as f:
+                    self.profiles[hmm] = list(f.optimized_profiles())
+        return self.profiles[hmm]
+
+    def search(self, f, hmm, col, shard=0, shards=1, z=0, score=''):
+        '''
+        (protein, accession, evalue, score) for every hit, formatted and ordered as in a hmmsearch tblout.
+        col 3 reports the profile accession, anything else the profile name.
+        A shard is a contiguous slice of the loaded profiles.
+        z: sequences in the whole chunk if f is part of it.
+        score: threshold of this database if it has its own.
+        '''
+        profiles = self.load(hmm)
+        profiles = profiles[len(profiles)*shard//shards:len(profiles)*(shard+1)//shards]
+        with pyhmmer.easel.SequenceFile(f, digital=True, alphabet=self.alphabet) as seqs:
+            block = seqs.read_block()
+        pipe = pyhmmer.plan7.Pipeline(self.alphabet, T=float(score) if score else self.score, Z=z or len(block)) # as with hmmsearch
+        for profile in profiles:
+            acc = text(profile.accession if col == 3 else profile.name) or '-'
+            hits = pipe.search_hmm(profile.copy(), block)
+            for hit in hits.reported:
+                yield text(hit.name), acc, f'{hit.evalue:.2g}', f'{hit.score:.1f}'
+            pipe.clear()
@@ -2,83 +2,87 @@
 # Author: Kristopher Kieft
 # University of Wisconsin-Madison
 
+import os
 import sys
-import pandas as pd
+import itertools
+from scripts.databases import VIBRANT
+
+
+def tblout_lines(lines, col):
+    '''
+    (protein, accession, evalue, score) for every hit in the lines of a hmmsearch tblout.
+    '''
+    for line in lines:
+        if line[0] == '#':
+            continue
+        line = line.split()
+        yield line[0], line[col], line[4], line[5]
+
+def tblout_rows(path, col):
+    with open(path) as f:
+        yield from tblout_lines(f, col)
+
+def best_hits(rows, full=None):
+    '''
+    Single pass: keep the lowest evalue hit per protein, first one wins ties.
+    Every row is also written to full if given.
+    '''
+    best = {}
+    for row in rows:
+        if full:
+            full.write('\t'.join(row) + '\n')
+        evalue = float(row[2])
+        hold = best.get(row[0])
+        if not hold or evalue < hold[0]:
+            best[row[0]] = (evalue, row)
+    return [row for _,row in best.values()]
+
+def write_best(rows, parsed, full=None):
+    '''
+    Write the best hit per protein to parsed, and every hit to full if given.
+    '''
+    if full:
+        with open(full, 'w') as f:
+            best = best_hits(rows, f)
+    else:
+        best = best_hits(rows)
+    with open(parsed, 'w') as out:
+        out.write('protein\taccession\tevalue\tscore\n')
+        for row in best:
+            out.write('\t'.join(row) + '\n')
 
 
 class HMMparse:
-    def __init__(self, base, folder):
+    '''
+    shards: {database name: number of shards searched}, one each by default.
+    columns: {database name: tblout column holding the annotation}, the VIBRANT databases by default.
+    '''
+    def __init__(self, base, folder, keep=False, shards=None, columns=None):
         self.base = base
         self.parsed = f'{folder}parsed_hmm_results/'
         self.raw = f'{folder}raw_hmm_results/'
+        self.keep = keep
+        self.shards = shards or {}
+        self.columns = columns or {name: col for name,_,col in VIBRANT}
 
-        self.kegg()
-        self.pfam()
-        self.vog()
-
-    def kegg(self):
-        with open(f'{self.raw}{self.base}.KEGG.temp') as f, open(f'{self.raw}{self.base}.KEGG.hmmtbl', 'w') as out:
-            #out.write('protein\taccession\tevalue\tscore\n')
-            next(f)
-            next(f)
-            next(f)
-            for line in f:
-                if line[0] == '#':
-                    break
-                line = list(filter(None, line.split(' ')))
-                prot = line[0]
-                acc = line[2]
-                evalue = line[4]
-                score = line[5]
-                out.write(f'{prot}\t{acc}\t{evalue}\t{score}\n')
-        
-        df = pd.read_table(f'{self.raw}{self.base}.KEGG.hmmtbl', names=['protein', 'accession', 'evalue', 'score'])
-        df.sort_values(by='evalue', ascending=True, inplace=True)
-        df.drop_duplicates(subset='protein', keep='first', inplace=True)
-        df.to_csv(f'{self.parsed}{self.base}.KEGG.tsv', index=False, sep='\t')
-
-
-    def pfam(self):
-        with open(f'{self.raw}{self.base}.Pfam.temp') as f, open(f'{self.raw}{self.base}.Pfam.hmmtbl', 'w') as out:
-            #out.write('protein\taccession\tevalue\tscore\n')
-            next(f)
-            next(f)
-            next(f)
-            for line in f:
-                if line[0] == '#':
-                    break
-                line = list(filter(None, line.split(' ')))
-                prot = line[0]
-                acc = line[3]
-                evalue = line[4]
-                score = line[5]
-                out.write(f'{prot}\t{acc}\t{evalue}\t{score}\n')
-        
-        df = pd.read_table(f'{self.raw}{self.base}.Pfam.hmmtbl', names=['protein', 'accession', 'evalue', 'score'])
-        df.sort_values(by='evalue', ascending=True, inplace=True)
-        df.drop_duplicates(subset='protein', keep='first', inplace=True)
-        df.to_csv(f'{self.parsed}{self.base}.Pfam.tsv', index=False, sep='\t')
+        for name in self.columns:
+            self.parse(name)
 
-    def vog(self):
-        with open(f'{self.raw}{self.base}.VOG.temp') as f, open(f'{self.raw}{self.base}.VOG.hmmtbl', 'w') as out:
-            #out.write('protein\taccession\tevalue\tscore\n')
-            next(f)
-            next(f)
-            next(f)
-            for line in f:
-                if line[0] == '#':
-                    break
-                line = list(filter(None, line.split(' ')))
-                prot = line[0]
-                acc = line[2]
-                evalue = line[4]
-                score = line[5]
-                out.write(f'{prot}\t{acc}\t{evalue}\t{score}\n')
-        
-        df = pd.read_table(f'{self.raw}{self.base}.VOG.hmmtbl', names=['protein', 'accession', 'evalue', 'score'])
-        df.sort_values(by='evalue', ascending=True, inplace=True)
-        df.drop_duplicates(subset='protein', keep='first', inplace=True)
-        df.to_csv(f'{self.parsed}{self.base}.VOG.tsv', index=False, sep='\t')
+    def parse(self, name):
+        '''
+        Reduce the raw tblouts of all shards, in shard order, to the best hit per protein.
+        The full hit table (.hmmtbl) is only written if keep is set.
+        '''
+        rows = []
+        for i in range(self.shards.get(name, 1)):
+            temp = f'{self.raw}{self.base}.{name}.{i}.temp'
+            if os.path.exists(temp): # not there if all proteins came from the hit cache
+                rows.append(tblout_rows(temp, self.columns[name]))
+        rows = itertools.chain(*rows)
+        full = None
+        if self.keep:
+            full = f'{self.raw}{self.base}.{name}.hmmtbl'
+        write_best(rows, f'{self.parsed}{self.base}.{name}.tsv', full)
 
 if __name__ == '__main__':
-    HMMparse(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    HMMparse(sys.argv[1], sys.argv[2])
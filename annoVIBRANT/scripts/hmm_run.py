@@ -3,54 +3,289 @@
 # University of Wisconsin-Madison
 
 
+import io
 import os
+import gzip
+import time
+import hashlib
 import subprocess
+import threading
+import itertools
+from fasta_parse import fasta_parse
+from scripts import profiler
+from scripts.chunks import chunk_base
+from scripts.hit_cache import digest
+from scripts.hmm_parse import best_hits, tblout_lines, write_best
 
 
-class HMMsearch:
+def fingerprint(hmm):
+    '''
+    Database identity: file name, size and a digest of the first and last megabyte.
+    '''
+    size = os.path.getsize(hmm)
+    h = hashlib.md5()
+    with open(hmm, 'rb') as f:
+        h.update(f.read(1048576))
+        f.seek(max(0, size-1048576))
+        h.update(f.read())
+    return f'{hmm.rsplit("/",1)[-1]}:{size}:{h.hexdigest()}'
+
 
-    def __init__(self, folder, db, score):
+class HMMsearch:
+    '''
+    Every (chunk, database shard) pair is one job on the shared pool.
+    Cost is estimated as chunk size x database size / shards so the longest searches start first.
+    finished(base) is called once all searches of a chunk are done.
+    databases: the registry ([name, HMM path, tblout column, score threshold], see databases.py).
+    With a hit cache only proteins missing from the cache are searched.
+    With an in-process engine the hits are reduced straight to parsed_hmm_results/.
+    shards: {database name: [HMM paths]}, the whole database by default.
+    With dedup only the first copy of identical proteins in a chunk is searched.
+    Searches of part of a chunk set Z to the chunk size, so E-values are those of the whole chunk.
+    stream: path prefix; hmmsearch tblouts are then piped straight into the reducer and,
+    with keep, the full hits appended to <prefix>.<db>.hmmtbl.gz instead of kept per chunk.
+    queue: a work_queue.WorkQueue; hmmsearch then runs on its workers and the tblouts
+    are picked up as they arrive.
+    Every search is recorded in the run profile.
+    '''
+    def __init__(self, folder, databases, score, pool, manifest, finished=None, cache=None, engine=None, keep=False, shards=None, dedup=False, stream=None, profile=None, queue=None):
         self.folder = folder
         self.results = f'{self.folder}raw_hmm_results/'
-        os.mkdir(self.results)
-        self.db = db
-        self.score = score
-        self.files = os.listdir(f'{self.folder}split_files/')
-        self.files = [f'{self.folder}split_files/{f}' for f in self.files if f[-4:] == '.faa']
-        
-        self.kegg()
-        self.pfam()
-        self.vog()
-    
-    def kegg(self):
-        holder = []
-        for f in self.files:
-            base = f.rsplit('.',1)[0].rsplit('/',1)[1]
-            out = f'{self.results}{base}.KEGG.temp'
-            hmm = f'{self.db}KEGG_profiles_prokaryotes.HMM'
-            s = subprocess.Popen(f'hmmsearch --tblout {out} -T {self.score} --cpu 1 --noali {hmm} {f} > /dev/null', shell=True)
-            holder.append(s)
-        for h in holder:
-            h.wait()
-    
-    def pfam(self):
-        holder = []
-        for f in self.files:
-            base = f.rsplit('.',1)[0].rsplit('/',1)[1]
-            out = f'{self.results}{base}.Pfam.temp'
-            hmm = f'{self.db}Pfam-A_v32.HMM'
-            s = subprocess.Popen(f'hmmsearch --tblout {out} -T {self.score} --cpu 1 --noali {hmm} {f} > /dev/null', shell=True)
-            holder.append(s)
-        for h in holder:
-            h.wait()
-    
-    def vog(self):
-        holder = []
-        for f in self.files:
-            base = f.rsplit('.',1)[0].rsplit('/',1)[1]
-            out = f'{self.results}{base}.VOG.temp'
-            hmm = f'{self.db}VOGDB94_phage.HMM'
-            s = subprocess.Popen(f'hmmsearch --tblout {out} -T {self.score} --cpu 1 --noali {hmm} {f} > /dev/null', shell=True)
-            holder.append(s)
-        for h in holder:
-            h.wait()
\ No newline at end of file
+        os.makedirs(self.results, exist_ok=True)
+        self.hmms = {name: hmm for name,hmm,_,_ in databases}
+        self.columns = {name: col for name,_,col,_ in databases}
+        self.scores = {name: threshold or score for name,_,_,threshold in databases}
+        self.pool = pool
+        self.manifest = manifest
+        self.finished = finished
+        self.cache = cache
+        self.engine = engine
+        self.keep = keep
+        self.dedup = dedup
+        self.stream = stream
+        self.work = queue
+        self.profile = profile or profiler.Profiler()
+        self.shards = shards or {name: [hmm] for name,hmm,_,_ in databases}
+        self.count = sum(len(v) for v in self.shards.values())
+        self.hits = {}
+        self.sizes = {}
+        self.remaining = {}
+        self.lock = threading.Lock()
+        if self.cache:
+            self.identity = {name: fingerprint(hmm) for name,hmm,_,_ in databases}
+        if self.stream and self.keep:
+            os.makedirs(self.stream.rsplit('/',1)[0], exist_ok=True)
+            for name in self.hmms:
+                if not os.path.exists(f'{self.stream}.{name}.hmmtbl.gz'): # kept when resuming
+                    with open(f'{self.stream}.{name}.hmmtbl.gz', 'wb') as f:
+                        f.write(gzip.compress(b'protein\taccession\tevalue\tscore\n'))
+
+    def submit(self, files):
+        jobs = []
+        for f in files:
+            base = chunk_base(f)
+            with self.lock:
+                self.remaining[base] = self.count
+            if self.cache:
+                self.pool.submit(self.lookup, f, base, stage=1, cost=float('inf'))
+                continue
+            if self.dedup:
+                self.pool.submit(self.collapse, f, base, stage=1, cost=float('inf'))
+                continue
+            for name in self.hmms:
+                jobs += self.job(f, base, name)
+        self.queue(jobs)
+
+    def job(self, f, base, name, z=0):
+        '''
+        One search per shard of the database. z: sequences in the whole chunk if f is part of it.
+        '''
+        cost = self.cost(f, name)
+        return [(cost, f, base, name, i, hmm, z) for i,hmm in enumerate(self.shards[name])]
+
+    def cost(self, f, name):
+        return os.path.getsize(f) * os.path.getsize(self.hmms[name]) / len(self.shards[name])
+
+    def queue(self, jobs):
+        jobs.sort(reverse=True)
+        for cost,f,base,name,i,hmm,z in jobs:
+            self.pool.submit(self.search, f, base, name, i, hmm, z, stage=1, cost=cost)
+
+    def search(self, f, base, name, i, hmm, z=0):
+        if self.engine or self.stream:
+            self.search_rows(f, base, name, i, hmm, z)
+        elif not self.manifest.done(base, 'search', f'{name}.{i}'):
+            out = f'{self.results}{base}.{name}.{i}.temp'
+            if self.work:
+                self.remote(f, base, name, i, hmm, z, out)
+                return
+            z = f'-Z {z} ' if z else ''
+            with self.profile.job('search', base, self.label(name, i), [f]):
+                profiler.run(f'hmmsearch --tblout {out} -T {self.scores[name]} {z}--cpu 1 --noali {hmm} {f} > /dev/null', shell=True)
+            self.manifest.record(base, 'search', f'{name}.{i}', [out])
+        self.searched(base)
+
+    def remote(self, f, base, name, i, hmm, z, out):
+        '''
+        Paths are made absolute for workers started elsewhere.
+        '''
+        job = {'hmm': os.path.abspath(hmm), 'fasta': os.path.abspath(f), 'out': os.path.abspath(out), 'score': self.scores[name], 'z': z}
+        self.work.submit(job, self.cost(f, name), self.pool, self.arrived, f, base, name, i, out, time.time()-self.profile.start)
+
+    def arrived(self, result, f, base, name, i, out, queued):
+        '''
+        A search done on the work queue; its profile record runs from queueing to arrival
+        with what the worker used.
+        '''
+        with self.profile.job('search', base, self.label(name, i), [f]) as job:
+            job['start'] = queued
+            profiler.add(result['usage'])
+        if result['returncode']:
+            raise subprocess.CalledProcessError(result['returncode'], f'hmmsearch {name}.{i} of chunk {base} on {result["host"]}')
+        self.manifest.record(base, 'search', f'{name}.{i}', [out])
+        self.searched(base)
+
+    def search_rows(self, f, base, name, i, hmm, z=0):
+        '''
+        Engine or piped hmmsearch hits go straight into the reducer. The best hits
+        (and with keep all hits) of each shard are held until every shard of the database
+        is searched, then reduced in shard order, which is the profile order of the database.
+        '''
+        if self.manifest.done(base, 'search', name):
+            return
+        shards = len(self.shards[name])
+        with self.profile.job('search', base, self.label(name, i), [f]):
+            if self.engine:
+                rows = self.engine.search(f, hmm, self.columns[name], i, shards, z, self.scores[name])
+            else:
+                rows = self.pipe(f, name, hmm, z)
+            full = io.StringIO() if self.keep else None
+            best = best_hits(rows, full)
+        with self.lock:
+            hold = self.hits.setdefault((base, name), {})
+            hold[i] = (best, full.getvalue() if full else '')
+            if len(hold) < shards:
+                return
+            del self.hits[(base, name)]
+        outputs = [f'{self.folder}parsed_hmm_results/{base}.{name}.tsv']
+        write_best(itertools.chain(*(hold[j][0] for j in range(shards))), outputs[0])
+        if self.keep:
+            full = ''.join(hold[j][1] for j in range(shards))
+            if self.stream:
+                self.append(name, full)
+            else:
+                outputs.append(f'{self.results}{base}.{name}.hmmtbl')
+                with open(outputs[1], 'w') as out:
+                    out.write(full)
+        self.manifest.record(base, 'search', name, outputs)
+
+    def pipe(self, f, name, hmm, z=0):
+        '''
+        Rows of a hmmsearch tblout read from a pipe, never written to disk.
+        '''
+        z = ['-Z', str(z)] if z else []
+        cmd = ['hmmsearch', '--tblout', '/dev/stdout', '-o', '/dev/null', '-T', self.scores[name], *z, '--cpu', '1', '--noali', hmm, f]
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        with p.stdout:
+            yield from tblout_lines(p.stdout, self.columns[name])
+        if profiler.reap(p):
+            raise subprocess.CalledProcessError(p.returncode, cmd)
+
+    def append(self, name, full):
+        '''
+        One gzip member per chunk; concatenated members are a valid gzip file.
+        '''
+        data = gzip.compress(full.replace('$~&', ' ').encode())
+        with self.lock:
+            with open(f'{self.stream}.{name}.hmmtbl.gz', 'ab') as out:
+                out.write(data)
+
+    def label(self, name, i):
+        return f'{name}.{i}' if len(self.shards[name]) > 1 else name
+
+    def searched(self, base, n=1):
+        with self.lock:
+            self.remaining[base] -= n
+            done = self.remaining[base] == 0
+        if done and self.finished:
+            self.finished(base)
+
+    def unique(self, f, base):
+        '''
+        (protein, digest, sequence) of the chunk and the number of proteins in it.
+        With dedup only the first copy of each sequence is returned and the others are
+        listed against it (copy, first) in split_files/<chunk>.dups.tsv for Annotations.
+        '''
+        proteins = [(name, digest(seq), seq) for name,seq in fasta_parse(f)]
+        if not self.dedup:
+            return proteins, len(proteins)
+        first = {}
+        with open(f'{self.folder}split_files/{base}.dups.tsv', 'w') as dups:
+            for prot,d,seq in proteins:
+                if d in first:
+                    dups.write(f'{prot.split(" ",1)[0]}\t{first[d][0].split(" ",1)[0]}\n')
+                else:
+                    first[d] = (prot, d, seq)
+        return list(first.values()), len(proteins)
+
+    def collapse(self, f, base):
+        '''
+        Search one copy of each distinct protein of the chunk, split_files/<chunk>.uniq.faa.
+        '''
+        with self.profile.job('dedup', base, '', [f]):
+            proteins, z = self.unique(f, base)
+            with open(f'{self.folder}split_files/{base}.uniq.faa', 'w') as out:
+                for prot,_,seq in proteins:
+                    out.write(f'>{prot}\n{seq}')
+        jobs = []
+        for name in self.hmms:
+            jobs += self.job(f'{self.folder}split_files/{base}.uniq.faa', base, name, z)
+        self.queue(jobs)
+
+    def lookup(self, f, base):
+        '''
+        Cached best hits go to parsed_hmm_results/<chunk>.<db>.cached.tsv and the
+        proteins missing from the cache to split_files/<chunk>.<db>.faa for searching.
+        '''
+        with self.profile.job('cache', base, '', [f]):
+            proteins, z = self.unique(f, base)
+            with self.lock:
+                self.sizes[base] = z # the Z its searches use, stored with their hits
+            jobs = []
+            for name in self.hmms:
+                hits = self.cache.lookup(self.identity[name], self.scores[name], {p[1] for p in proteins}, z)
+                missed = 0
+                with open(f'{self.folder}parsed_hmm_results/{base}.{name}.cached.tsv', 'w') as cached, open(f'{self.folder}split_files/{base}.{name}.faa', 'w') as search:
+                    cached.write('protein\taccession\tevalue\tscore\n')
+                    for prot,d,seq in proteins:
+                        if d not in hits:
+                            search.write(f'>{prot}\n{seq}')
+                            missed += 1
+                        elif hits[d][0]:
+                            acc,evalue,score = hits[d]
+                            cached.write(f'{prot.split(" ",1)[0]}\t{acc}\t{evalue}\t{score}\n')
+                if missed:
+                    jobs += self.job(f'{self.folder}split_files/{base}.{name}.faa', base, name, z)
+                else:
+                    self.searched(base, len(self.shards[name]))
+        self.queue(jobs)
+
+    def remember(self, base):
+        '''
+        Store the best hit (or no hit) of every searched protein once the chunk is parsed.
+        '''
+        for name in self.hmms:
+            searched = f'{self.folder}split_files/{base}.{name}.faa'
+            if os.path.getsize(searched) == 0:
+                continue
+            best = {}
+            with open(f'{self.folder}parsed_hmm_results/{base}.{name}.tsv') as f:
+                next(f)
+                for line in f:
+                    prot,acc,evalue,score = line.strip('\n').split('\t')
+                    best[prot] = (acc, evalue, score)
+            hits = []
+            for prot,seq in fasta_parse(searched):
+                acc,evalue,score = best.get(prot.split(' ',1)[0], ('', '', ''))
+                hits.append((digest(seq), acc, evalue, score))
+            self.cache.store(self.identity[name], self.scores[name], hits, self.sizes[base])
@@ -0,0 +1,117 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from scripts.hmm_run import fingerprint
+from scripts.aux_tables import cache_dir
+
+
+class ShardError(Exception):
+    pass
+
+
+def shard_dirs(db, hmm, n):
+    '''
+    Shards in the user cache, where they are built, then any already next to the database.
+    '''
+    key = hashlib.md5(os.path.abspath(f'{db}{hmm}').encode()).hexdigest()
+    return [f'{cache_dir()}shards_{key}/{hmm}.{n}/', f'{db}annoVIBRANT_shards/{hmm}.{n}/']
+
+def check_shards(db, hmm, n):
+    '''
+    Paths of pressed shards built from the current database, or None.
+    '''
+    identity = fingerprint(f'{db}{hmm}')
+    for folder in shard_dirs(db, hmm, n):
+        try:
+            with open(f'{folder}shards.ok') as f:
+                marker = f.read().split('\n')
+        except OSError:
+            continue
+        if marker[0] == identity:
+            return [f'{folder}{i}.hmm' for i in range(int(marker[1]))]
+    return None
+
+def split_hmm(hmm, n, folder):
+    '''
+    Split hmm into at most n contiguous pieces of similar size, <folder><i>.hmm.
+    Contiguous pieces keep the profile order, so shard hits read in shard order
+    are in the order hmmsearch reports them for the whole database.
+    Returns the number of shards written.
+    '''
+    size = os.path.getsize(hmm)
+    shard = 0
+    written = 0
+    start = 0
+    out = open(f'{folder}0.hmm', 'wb')
+    with open(hmm, 'rb') as f:
+        for line in f:
+            out.write(line)
+            written += len(line)
+            if line[:2] == b'//' and shard < n-1 and written >= size*(shard+1)/n:
+                out.close()
+                shard += 1
+                start = written
+                out = open(f'{folder}{shard}.hmm', 'wb')
+    out.close()
+    if written == start and shard > 0: # database ended on a shard boundary
+        os.remove(f'{folder}{shard}.hmm')
+        shard -= 1
+    return shard + 1
+
+def build_shards(db, hmm, n):
+    '''
+    Split and press the database in a temporary folder of the user cache, then move it
+    into place. If another run finished the same shards first, its copy is kept.
+    Raises ShardError if they cannot be written or pressed.
+    '''
+    identity = fingerprint(f'{db}{hmm}')
+    folder = shard_dirs(db, hmm, n)[0]
+    parent = folder.rstrip('/').rsplit('/',1)[0]
+    try:
+        os.makedirs(parent, exist_ok=True)
+        temp = tempfile.mkdtemp(dir=parent) + '/'
+    except OSError as e:
+        raise ShardError(f'Could not write HMM shards for {hmm} in {parent}: {e.strerror}.')
+    try:
+        count = split_hmm(f'{db}{hmm}', n, temp)
+        for i in range(count):
+            if subprocess.run(f'hmmpress {temp}{i}.hmm > /dev/null', shell=True).returncode:
+                raise ShardError(f'hmmpress failed on shard {i} of {hmm}.')
+        with open(f'{temp}shards.ok', 'w') as f:
+            f.write(f'{identity}\n{count}\n')
+    except OSError as e: # full disk, quota
+        shutil.rmtree(temp, ignore_errors=True)
+        raise ShardError(f'Could not write HMM shards for {hmm} in {parent}: {e.strerror}.')
+    except ShardError:
+        shutil.rmtree(temp, ignore_errors=True)
+        raise
+    try:
+        os.rename(temp, folder)
+    except OSError: # already there, from another run or an older database
+        if check_shards(db, hmm, n):
+            shutil.rmtree(temp, ignore_errors=True)
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+            os.rename(temp, folder)
+    return check_shards(db, hmm, n)
+
+def shard_databases(databases, n):
+    '''
+    {database name: [shard HMM paths]} for the registry, building the shards on first use.
+    A single shard is the database itself.
+    '''
+    shards = {}
+    for name,path,_,_ in databases:
+        if n == 1:
+            shards[name] = [path]
+        else:
+            db,hmm = os.path.split(path)
+            db = f'{db}/' if db else ''
+            shards[name] = check_shards(db, hmm, n) or build_shards(db, hmm, n)
+    return shards
@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import itertools
+import queue
+import threading
+
+
+class JobPool:
+    '''
+    Fixed number of worker threads pulling from one priority queue.
+    Jobs from later pipeline stages go first so finished chunks drain,
+    then jobs with the largest cost.
+    hold()/release() count work done outside the pool (a search on the work queue),
+    so wait() also waits for it. Whatever follows it is submitted before the release.
+    '''
+    def __init__(self, threads):
+        self.threads = threads
+        self.jobs = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.errors = []
+        self.held = 0
+        self.released = threading.Condition()
+
+        for _ in range(self.threads):
+            t = threading.Thread(target=self.worker, daemon=True)
+            t.start()
+
+    def submit(self, func, *args, stage=0, cost=0):
+        self.jobs.put((-stage, -cost, next(self.order), func, args))
+
+    def worker(self):
+        while True:
+            _,_,_,func,args = self.jobs.get()
+            try:
+                func(*args)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.jobs.task_done()
+
+    def hold(self):
+        with self.released:
+            self.held += 1
+
+    def release(self):
+        with self.released:
+            self.held -= 1
+            self.released.notify_all()
+
+    def wait(self):
+        while True:
+            self.jobs.join()
+            with self.released:
+                if not self.held:
+                    break
+                while self.held:
+                    self.released.wait()
+        if self.errors:
+            raise self.errors[0]
+
+
+class Group:
+    '''
+    The jobs of one run on a shared JobPool, with the same submit/wait interface.
+    wait() returns once this run's jobs are done and raises its first error.
+    '''
+    def __init__(self, pool):
+        self.pool = pool
+        self.pending = 0
+        self.errors = []
+        self.done = threading.Condition()
+
+    def submit(self, func, *args, stage=0, cost=0):
+        with self.done:
+            self.pending += 1
+        self.pool.submit(self.job, func, args, stage=stage, cost=cost)
+
+    def hold(self):
+        with self.done:
+            self.pending += 1
+
+    def release(self):
+        with self.done:
+            self.pending -= 1
+            self.done.notify_all()
+
+    def job(self, func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            with self.done:
+                self.pending -= 1
+                self.done.notify_all()
+
+    def wait(self):
+        with self.done:
+            while self.pending:
+                self.done.wait()
+        if self.errors:
+            raise self.errors[0]
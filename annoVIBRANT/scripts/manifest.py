@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import json
+import hashlib
+import threading
+
+
+STAGES = {'split': 0, 'prodigal': 1, 'search': 2, 'annotate': 3, 'merge': 4}
+
+
+def checksum(path):
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1048576), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def stamp(path):
+    '''
+    Size and modification time of an output, enough to tell it was rewritten or cut short.
+    '''
+    s = os.stat(path)
+    return [s.st_size, s.st_mtime_ns]
+
+
+class Manifest:
+    '''
+    Append-only run manifest (JSON lines) in the output folder.
+    The first line records the input checksum and parameters, every other line
+    one completed (chunk, stage, database) unit with the size and mtime of its outputs.
+    Every line is flushed; run-level units (split, merge) are also synced to disk, so a
+    crash loses at most the chunk units since the split, which are redone.
+    '''
+    def __init__(self, folder):
+        self.path = f'{folder}run_manifest.jsonl'
+        self.lock = threading.Lock()
+        self.units = {}
+        self.redone = {}
+
+    def start(self, infile, params):
+        self.run = {'input': infile, 'checksum': checksum(infile), 'params': params}
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(self.run) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load(self, infile, params):
+        '''
+        Returns False if there is no manifest or it belongs to a different input or parameters.
+        '''
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            lines = f.read().split('\n')
+        try:
+            self.run = json.loads(lines[0])
+        except ValueError:
+            return False
+        if self.run['params'] != params or self.run['checksum'] != checksum(infile):
+            return False
+        for line in lines[1:]:
+            try:
+                unit = json.loads(line)
+            except ValueError:
+                continue # partial last line of a killed run
+            self.units[(unit['chunk'], unit['stage'], unit['db'])] = unit['outputs']
+        return True
+
+    def done(self, chunk, stage, db=''):
+        '''
+        A unit is done if it was recorded, its outputs are intact and nothing
+        it depends on (earlier stages of the same chunk, or the split) was redone.
+        '''
+        rank = STAGES[stage]
+        with self.lock:
+            if self.redone.get('', rank) < rank or self.redone.get(chunk, rank) < rank:
+                return False
+            outputs = self.units.get((chunk, stage, db))
+        if outputs is None:
+            return False
+        for path,digest in outputs.items():
+            if not os.path.exists(path):
+                return False
+            if isinstance(digest, str): # md5 in manifests of older versions
+                if checksum(path) != digest:
+                    return False
+            elif stamp(path) != digest:
+                return False
+        return True
+
+    def record(self, chunk, stage, db, outputs):
+        outputs = {path: stamp(path) for path in outputs if os.path.exists(path)}
+        line = json.dumps({'chunk': chunk, 'stage': stage, 'db': db, 'outputs': outputs})
+        with self.lock:
+            self.units[(chunk, stage, db)] = outputs
+            self.redone[chunk] = min(self.redone.get(chunk, STAGES[stage]), STAGES[stage])
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                if not chunk:
+                    os.fsync(f.fileno())
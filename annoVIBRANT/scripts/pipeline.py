@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from scripts import hmm_run
+from scripts import hmm_parse
+from scripts import annotations
+from scripts import job_pool
+from scripts import run_prodigal
+from scripts import profiler
+from scripts.chunks import chunk_base, chunk_files
+
+
+def processes(threads):
+    '''
+    Fork-context process pool with every worker started now, before any pool thread runs
+    Prodigal or hmmsearch. A worker forked later (on the first submit) could inherit the
+    pipe of a subprocess another thread is starting, and that Popen would wait forever.
+    '''
+    procs = ProcessPoolExecutor(threads, mp_context=multiprocessing.get_context('fork'))
+    for started in [procs.submit(os.getpid) for _ in range(threads)]:
+        started.result()
+    return procs
+
+def pools(threads, tables):
+    '''
+    Thread and process pools shared by several runs (server and batch modes).
+    The auxiliary tables are set before the process pool forks.
+    '''
+    annotations.TABLES = tables
+    procs = processes(threads)
+    return job_pool.JobPool(threads), procs
+
+
+class Pipeline:
+    '''
+    Chunk-level dataflow: in nucl mode each chunk goes to hmmsearch as soon as
+    its own Prodigal run is done, and as soon as the searches of a chunk (one per database
+    of the registry, or per shard) are done its hmm_parse and annotations steps are queued, ahead of any waiting search.
+    Units already recorded in the manifest are skipped.
+    Python-side work (hmm_parse, annotations) runs in a process pool started once for the run.
+    The auxiliary tables are loaded before the pool forks, so workers share them copy-on-write.
+    With an in-process search engine or streamed hmmsearch the searches already leave parsed hits and hmm_parse is skipped.
+    A shared JobPool and process pool can be passed in (server mode), the run then waits on its own jobs only.
+    With a work queue the searches run on its workers, everything else here.
+    With a gene cache Prodigal only calls scaffolds it has not seen (see gene_cache.py).
+    Every Prodigal, search, parse and annotate job is recorded in the run profile.
+    '''
+    def __init__(self, folder, databases, aux, score, form, threads, manifest, cache=None, keep=False, tables=None, engine=None, shards=None, pool=None, procs=None, dedup=False, stream=None, profile=None, queue=None, gene_cache=None):
+        self.folder = folder
+        self.aux = aux
+        self.form = form
+        self.manifest = manifest
+        self.databases = databases
+        self.cache = cache
+        self.keep = keep
+        self.engine = engine
+        self.stream = stream
+        self.gene_cache = gene_cache
+        self.profile = profile or profiler.Profiler()
+        self.shards = {name: len(hmms) for name,hmms in shards.items()} if shards else None
+        os.makedirs(f'{self.folder}parsed_hmm_results/', exist_ok=True)
+        os.makedirs(f'{self.folder}annotations_temp/', exist_ok=True)
+
+        annotations.TABLES = tables
+        self.procs = procs or processes(threads)
+        self.pool = job_pool.Group(pool) if pool else job_pool.JobPool(threads)
+        self.search = hmm_run.HMMsearch(folder, databases, score, self.pool, self.manifest, self.searched, self.cache, self.engine, self.keep, shards, dedup, stream, self.profile, queue)
+        if self.form == 'nucl':
+            files = chunk_files(f'{self.folder}split_files/', '.fna')
+            files.sort(key=os.path.getsize, reverse=True)
+            for f in files:
+                self.pool.submit(self.genes, f, cost=os.path.getsize(f))
+        else:
+            self.search.submit(chunk_files(f'{self.folder}split_files/', '.faa'))
+        try:
+            self.pool.wait()
+        finally:
+            if not procs:
+                self.procs.shutdown()
+
+    def genes(self, f):
+        base = f.rsplit('.',1)[0]
+        if not self.manifest.done(chunk_base(f), 'prodigal'):
+            with self.profile.job('prodigal', chunk_base(f), '', [f]):
+                if self.gene_cache:
+                    run_prodigal.cached(f, self.gene_cache)
+                else:
+                    run_prodigal.prodigal(f)
+            self.manifest.record(chunk_base(f), 'prodigal', '', [f'{base}.faa', f'{base}.ffn', f'{base}.gff'])
+        self.search.submit([f'{base}.faa'])
+
+    def searched(self, base):
+        self.pool.submit(self.annotate, base, stage=2)
+
+    def annotate(self, base):
+        if self.manifest.done(base, 'annotate'):
+            return
+        if not (self.engine or self.stream):
+            with self.profile.job('parse', base, '', self.raw(base)):
+                profiler.add(self.procs.submit(profiler.measured, hmm_parse.HMMparse, base, self.folder, self.keep, self.shards, {name: col for name,_,col,_ in self.databases}).result())
+        if self.cache:
+            with self.profile.job('cache', base):
+                self.search.remember(base)
+        parsed = [f'{self.folder}parsed_hmm_results/{base}.{name}.{ext}' for name,_,_,_ in self.databases for ext in ('tsv', 'cached.tsv')]
+        with self.profile.job('annotate', base, '', parsed):
+            profiler.add(self.procs.submit(profiler.measured, annotations.annotate, base, self.folder, self.aux, self.form, [name for name,_,_,_ in self.databases]).result())
+        outputs = [f'{self.folder}split_files/{base}.accnos']
+        for name,_,_,_ in self.databases:
+            outputs += [f'{self.folder}parsed_hmm_results/{base}.{name}.tsv', f'{self.folder}raw_hmm_results/{base}.{name}.hmmtbl'] # hmmtbl only with keep
+        for ext in ('full', 'best', 'amgs'):
+            outputs.append(f'{self.folder}annotations_temp/{base}.{ext}.tsv')
+        self.manifest.record(base, 'annotate', '', outputs)
+
+    def raw(self, base):
+        shards = self.shards or {}
+        return [f'{self.folder}raw_hmm_results/{base}.{name}.{i}.temp' for name,_,_,_ in self.databases for i in range(shards.get(name, 1))]
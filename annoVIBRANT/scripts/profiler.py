@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import json
+import time
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+
+
+LOCAL = threading.local() # job being profiled on this thread, picks up its subprocesses
+
+
+def read_io(path):
+    '''
+    Bytes read and written according to a Linux /proc io file, zeros elsewhere.
+    '''
+    counts = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key,value = line.split(':')
+                counts[key] = int(value)
+    except OSError:
+        pass
+    return counts.get('rchar', 0), counts.get('wchar', 0)
+
+def counters():
+    '''
+    CPU seconds, bytes read and bytes written by the calling thread so far.
+    '''
+    return (time.thread_time(),) + read_io('/proc/thread-self/io')
+
+def usage(start):
+    end = counters()
+    return {'cpu': end[0]-start[0], 'read': end[1]-start[1], 'written': end[2]-start[2],
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+def measured(func, *args):
+    '''
+    Process pool entry point: run func and send back what it used in the worker.
+    '''
+    start = counters()
+    func(*args)
+    return usage(start)
+
+def merge(job, used):
+    for key in ('cpu', 'read', 'written'):
+        job[key] += used[key]
+    job['max_rss_kb'] = max(job['max_rss_kb'], used['max_rss_kb'])
+
+def add(used):
+    '''
+    Count work done elsewhere (a subprocess or a pool worker) towards the job on this thread.
+    '''
+    job = getattr(LOCAL, 'job', None)
+    if job is not None:
+        merge(job, used)
+
+def reap(p):
+    '''
+    Wait for a subprocess and count its CPU time, peak RSS and I/O, children included.
+    '''
+    os.waitid(os.P_PID, p.pid, os.WEXITED | os.WNOWAIT) # still readable in /proc
+    read,written = read_io(f'/proc/{p.pid}/io')
+    _,status,ru = os.wait4(p.pid, 0)
+    p.returncode = os.waitstatus_to_exitcode(status)
+    add({'cpu': ru.ru_utime + ru.ru_stime, 'read': read, 'written': written, 'max_rss_kb': ru.ru_maxrss})
+    return p.returncode
+
+def run(cmd, **kwargs):
+    '''
+    subprocess.run for the external tools, with their usage added to the current job.
+    '''
+    p = subprocess.Popen(cmd, **kwargs)
+    return reap(p)
+
+
+class Profiler:
+    '''
+    One JSON line per stage or job in <folder>profile.jsonl: wall and CPU seconds,
+    peak RSS of the process that did the work, bytes read and written and input size.
+    Start and end are seconds since the run started.
+    Without a folder the records are only kept in memory.
+    '''
+    def __init__(self, folder=None):
+        self.path = f'{folder}profile.jsonl' if folder else None
+        self.start = time.time()
+        self.lock = threading.Lock()
+        self.records = []
+
+    @contextmanager
+    def job(self, stage, chunk='', db='', inputs=()):
+        size = sum(os.path.getsize(f) for f in inputs if os.path.exists(f))
+        job = {'stage': stage, 'chunk': chunk, 'db': db, 'input_bytes': size, 'start': time.time()-self.start, 'cpu': 0, 'read': 0, 'written': 0, 'max_rss_kb': 0}
+        hold = getattr(LOCAL, 'job', None)
+        LOCAL.job = job
+        start = counters()
+        try:
+            yield job
+        finally:
+            LOCAL.job = hold
+            used = usage(start)
+            if job['max_rss_kb']: # the work was done by a subprocess or pool worker
+                used['max_rss_kb'] = 0
+            merge(job, used)
+            job['end'] = time.time() - self.start
+            job['wall'] = job['end'] - job['start']
+            with self.lock:
+                self.records.append(job)
+                if self.path:
+                    with open(self.path, 'a') as f:
+                        f.write(json.dumps(job) + '\n')
+
+    def summary(self):
+        '''
+        Per-stage totals and throughput, and the critical path: split, then the
+        chunk that finished annotating last with the search it waited for, then the merge.
+        '''
+        lines = ['', 'Stage       jobs    wall (s)     CPU (s)  input (MB)    MB/s']
+        stages = {}
+        for job in self.records:
+            s = stages.setdefault(job['stage'], [0, 0, 0, 0])
+            s[0] += 1
+            s[1] += job['wall']
+            s[2] += job['cpu']
+            s[3] += job['input_bytes']
+        for stage,(n,wall,cpu,size) in stages.items():
+            rate = size / 1048576 / wall if wall else 0
+            lines.append(f'{stage:10} {n:5} {wall:11.2f} {cpu:11.2f} {size/1048576:11.2f} {rate:7.2f}')
+
+        chunks = [job for job in self.records if job['chunk']]
+        path = [job for job in self.records if job['stage'] == 'split']
+        if chunks:
+            last = max((job for job in chunks if job['stage'] == 'annotate'), key=lambda job: job['end'], default=None)
+            if last:
+                steps = {}
+                for job in chunks:
+                    if job['chunk'] == last['chunk'] and job['end'] <= last['end']:
+                        if job['stage'] not in steps or job['end'] > steps[job['stage']]['end']:
+                            steps[job['stage']] = job
+                path += sorted(steps.values(), key=lambda job: job['start'])
+        path += [job for job in self.records if job['stage'] in ('merge', 'cleanup')]
+        lines.append('')
+        lines.append('Critical path')
+        for job in path:
+            name = ' '.join(x for x in (job['stage'], f'chunk {job["chunk"]}' if job['chunk'] else '', job['db']) if x)
+            lines.append(f'{job["start"]:9.2f} - {job["end"]:9.2f}  {job["wall"]:9.2f} s  {name}')
+        if path:
+            busy = sum(job['wall'] for job in path)
+            lines.append(f'Waiting in queue on the critical path: {max(0, path[-1]["end"]-path[0]["start"]-busy):.2f} s')
+        return lines
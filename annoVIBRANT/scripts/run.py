@@ -0,0 +1,177 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import sys
+import time
+import shutil
+from datetime import datetime,date
+from scripts import split_prot
+from scripts import split_nucl
+from scripts import combine_clean
+from scripts import pipeline
+from scripts import manifest
+from scripts import update as updates
+from scripts.profiler import Profiler
+from scripts.aux_tables import AuxTables
+from scripts.chunks import chunk_files
+
+
+class RunError(Exception):
+    pass
+
+class RunComplete(RunError):
+    pass
+
+
+def base_name(infile):
+    '''
+    Sample name: the input file name without its extension.
+    '''
+    return infile.rsplit('/',1)[-1].rsplit('.',1)[0]
+
+def logit(folder, hold_time, start_time, date_today, program, cmd=None):
+    runtime = round((time.time()-hold_time)/60,2)
+    end_time = datetime.now().strftime("%H:%M")
+    with open(f'{folder}info.log', 'w') as f:
+        cmd = cmd or ' '.join(sys.argv)
+        f.write(f'Command:   {cmd}\n')
+        f.write(f'Date:      {date_today} (M/D/Y)\n')
+        f.write(f'Start:     {start_time}\n')
+        f.write(f'End:       {end_time}\n')
+        f.write(f'Runtime:   {runtime} minutes\n')
+        f.write(f'Program:   {program}\n')
+
+
+class Run:
+    '''
+    One annotation run of infile into folder: split, search and annotate, merge.
+    params: program, form, score, threads, db, databases, aux, keep, engine, shards, dedup, stream (as recorded in the manifest).
+    databases is the registry of databases.registry().
+    The hit and gene caches, auxiliary tables, search engine, shards, worker pools and work queue can be
+    passed in so several runs share them; otherwise they are set up for this run.
+    Stage and job usage goes to profile.jsonl and a summary to the end of info.log.
+    The fingerprint of each database goes to databases.json. With update, a finished run is
+    annotated again searching only the databases that changed since (see update.py);
+    an interrupted update is redone with update, not resume.
+    With memory the tables are kept in annotations (see CombineClean) instead of written,
+    for a folder that is removed afterwards: it cannot be updated.
+    '''
+    def __init__(self, infile, folder, base, params, resume=False, cache=None, tables=None, engine=None, shards=None, pool=None, procs=None, cmd=None, update=False, queue=None, gene_cache=None, memory=False):
+        hold_time = time.time()
+        start_time = datetime.now().strftime("%H:%M")
+        date_today = date.today().strftime("%m/%d/%y")
+        self.infile = infile
+        self.folder = folder
+        self.base = base
+        self.params = params
+        self.run = manifest.Manifest(folder)
+        form = params['form']
+        hmms = None
+        if update:
+            self.check_update()
+            self.run.start(infile, dict(params, update=True)) # not resumable as a plain run
+        elif resume:
+            self.check_resume()
+        else:
+            self.check_folder()
+            os.mkdir(folder)
+            self.run.start(infile, params)
+        self.profile = Profiler(folder)
+
+        if update:
+            cache = self.prepare_update()
+            form = 'prot' # proteins are already called
+            hmms = self.searched
+        else:
+            self.bins = params['threads']
+            self.split()
+        tables = tables or AuxTables(params['aux'])
+        stream = f'{folder}full_hmmsearch_results/{base}' if params['stream'] else None
+        pipeline.Pipeline(folder, params['databases'], params['aux'], params['score'], form, params['threads'], self.run, cache, params['keep'], tables, engine, shards, pool, procs, params['dedup'], stream, self.profile, queue, gene_cache)
+        keep = params['keep'] and not stream # streamed full hits are already in full_hmmsearch_results/
+        chunks = updates.chunk_sizes(chunk_files(f'{folder}split_files/', '.faa'))
+        combine = combine_clean.CombineClean(folder, base, params['aux'], form, keep, tables, self.profile, params['databases'], hmms, memory)
+        self.annotations = combine.annotations if memory else None
+        self.run.record('', 'merge', '', [])
+        if not memory: # no database_hits/ to update from
+            updates.record(folder, self.run.run['checksum'], params, self.bins, chunks)
+        logit(folder, hold_time, start_time, date_today, params['program'], cmd)
+        with open(f'{folder}info.log', 'a') as f:
+            f.write('\n'.join(self.profile.summary()) + '\n')
+
+    def check_folder(self):
+        if os.path.exists(self.folder):
+            raise RunError(f'Output folder {self.folder} exists!')
+
+    def check_resume(self):
+        if not self.run.load(self.infile, self.params):
+            raise RunError(f'Output folder {self.folder} has no run manifest matching this input and parameters. Cannot resume.')
+        if self.run.done('', 'merge'):
+            raise RunComplete(f'Run in {self.folder} is already complete.')
+
+    def check_update(self):
+        stored = updates.load(self.folder)
+        if not stored:
+            raise RunError(f'Output folder {self.folder} has no databases.json from a finished run. Cannot update.')
+        if stored['checksum'] != manifest.checksum(self.infile):
+            raise RunError(f'Output folder {self.folder} was annotated from a different input. Cannot update.')
+        if stored['form'] != self.params['form'] or stored['score'] != self.params['score']:
+            raise RunError(f'Output folder {self.folder} was annotated with -f {stored["form"]} -s {stored["score"]}. Cannot update.')
+        if 'chunks' not in stored:
+            raise RunError(f'Output folder {self.folder} does not record the chunks it was searched in, so E-values could not be kept consistent. Annotate it again instead of updating.')
+        self.bins = stored['bins']
+        self.chunks = stored['chunks']
+        self.reuse, self.searched = updates.changes(stored['databases'], self.params['databases'])
+        self.dropped = [d[0] for d in stored['databases'] if d[0] not in self.reuse and d[0] not in self.searched]
+        if not self.searched and [d[0] for d in stored['databases']] == [d[0] for d in self.params['databases']]:
+            raise RunComplete(f'Databases of {self.folder} are unchanged, nothing to update.')
+
+    def prepare_update(self):
+        '''
+        Split the proteins of the run again and clear what the update replaces.
+        Returns the stored hits of the unchanged databases, used in place of a hit cache.
+        '''
+        for temp in ('split_files', 'annotations_temp', 'parsed_hmm_results', 'raw_hmm_results'): # from an interrupted update
+            shutil.rmtree(f'{self.folder}{temp}/', ignore_errors=True)
+        if os.path.exists(f'{self.folder}profile.jsonl'):
+            os.remove(f'{self.folder}profile.jsonl')
+        for name in self.searched + self.dropped:
+            for f in (f'full_hmmsearch_results/{self.base}.{name}.hmmtbl', f'full_hmmsearch_results/{self.base}.{name}.hmmtbl.gz'):
+                if os.path.exists(f'{self.folder}{f}'):
+                    os.remove(f'{self.folder}{f}')
+        for name in self.dropped:
+            if os.path.exists(f'{self.folder}database_hits/{self.base}.{name}.tsv'):
+                os.remove(f'{self.folder}database_hits/{self.base}.{name}.tsv')
+        source = self.infile
+        if self.params['form'] == 'nucl':
+            source = f'{self.folder}prodigal_results/{self.base}.prodigal.faa'
+        with self.profile.job('split', inputs=[source]):
+            if self.params['form'] == 'nucl':
+                files = updates.split_proteins(source, self.folder, self.chunks)
+            else: # packing the input again into as many bins gives the same chunks
+                split_prot.SplitProt(self.infile, self.folder, self.bins)
+                files = chunk_files(f'{self.folder}split_files/', '.faa')
+            if updates.chunk_sizes(files) != [n for n in self.chunks if n]:
+                raise RunError(f'Proteins of {self.folder} do not match the chunks recorded in databases.json. Cannot update.')
+            stored = updates.StoredHits(self.folder, self.base, files, self.reuse)
+        self.run.record('', 'split', '', files)
+        return stored
+
+    def split(self):
+        if self.run.done('', 'split'):
+            return
+        form = self.params['form']
+        if os.path.exists(f'{self.folder}split_files/'):
+            shutil.rmtree(f'{self.folder}split_files/')
+        with self.profile.job('split', inputs=[self.infile]):
+            if form == 'nucl':
+                check = split_nucl.SplitNucl(self.infile, self.folder, self.params['threads'])
+                ext = '.fna'
+            elif form == 'prot':
+                check = split_prot.SplitProt(self.infile, self.folder, self.params['threads'])
+                ext = '.faa'
+        if not check.check:
+            raise RunError(f'Input fasta does not appear to be in the correct "{form}" format!')
+        self.run.record('', 'split', '', chunk_files(f'{self.folder}split_files/', ext))
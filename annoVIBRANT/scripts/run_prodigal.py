@@ -3,20 +3,47 @@
 # University of Wisconsin-Madison
 
 import os
-import subprocess
+from fasta_parse import fasta_parse
+from scripts import profiler
+from scripts import gene_cache
 
 
-def prodigal(folder):
-    files = os.listdir(f'{folder}split_files')
-    files = [f'{folder}split_files/{f}' for f in files]
-   
-    holder = []
-    for f in files:
-        base = f.rsplit('.',1)[0]
-        faa = base + '.faa'
-        ffn = base + '.ffn'
-        gff = base + '.gff'
-        s = subprocess.Popen(f'prodigal -m -p meta -f gff -q -i {f} -a {faa} -d {ffn} -o {gff}', shell=True)
-        holder.append(s)
-    for h in holder:
-        h.wait()
+def prodigal(f):
+    base = f.rsplit('.',1)[0]
+    faa = base + '.faa'
+    ffn = base + '.ffn'
+    gff = base + '.gff'
+    profiler.run(f'prodigal -m -p meta -f gff -q -i {f} -a {faa} -d {ffn} -o {gff}', shell=True)
+    return faa
+
+def cached(f, cache):
+    '''
+    Prodigal outputs of chunk f with a gene cache: only scaffolds missing from the cache
+    (one copy of each) are called, in <chunk>.new.fna, and the calls of every scaffold are
+    spliced into the chunk's .faa/.ffn/.gff in input order with the chunk's Prodigal IDs.
+    '''
+    base = f.rsplit('.',1)[0]
+    scaffolds = [(name, gene_cache.scaffold_digest(seq)) for name,seq in fasta_parse(f)]
+    found = cache.lookup({d for _,d in scaffolds})
+    new = {}
+    with open(f'{base}.new.fna', 'w') as out:
+        for name,seq in fasta_parse(f):
+            d = gene_cache.scaffold_digest(seq)
+            if d not in found and d not in new:
+                new[d] = name
+                out.write(f'>{name}\n{seq}')
+    if new:
+        prodigal(f'{base}.new.fna')
+        genes = gene_cache.calls(f'{base}.new', list(new.values()))
+        found.update(zip(new, genes))
+        cache.store((d,) + g for d,g in zip(new, genes))
+    with open(f'{base}.faa', 'w') as faa, open(f'{base}.ffn', 'w') as ffn, open(f'{base}.gff', 'w') as gff:
+        if scaffolds:
+            gff.write('##gff-version  3\n')
+        for i,(name,d) in enumerate(scaffolds, 1):
+            for out,template in zip((faa, ffn, gff), found[d]):
+                out.write(gene_cache.fill(template, name, i))
+    for ext in ('fna', 'faa', 'ffn', 'gff'):
+        if os.path.exists(f'{base}.new.{ext}'):
+            os.remove(f'{base}.new.{ext}')
+    return f'{base}.faa'
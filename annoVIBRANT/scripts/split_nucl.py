@@ -3,8 +3,8 @@
 # University of Wisconsin-Madison
 
 from fasta_parse import fasta_parse
+from scripts.chunks import partition, distribute
 import os
-import math
 
 
 class SplitNucl:
@@ -13,7 +13,6 @@ class SplitNucl:
         self.infile = infile
         self.folder = folder + 'split_files/'
         self.threads = threads
-        self.ext = self.infile.rsplit('.',1)[1]
         self.check = True
 
         self.check_format()
@@ -34,24 +33,14 @@ class SplitNucl:
         if c != len(seq): # not nucl ATCGN format
             self.check = False
 
-    def bytes_per_file(self):
-        self.main = os.path.getsize(self.infile)
-        self.size = math.ceil(self.main/self.threads)
-
     def splitter(self):
-        self.bytes_per_file()
-        file = 1
-        for name,seq in fasta_parse(self.infile):
-            name = name.replace(" ", "$~&")
-
-            try:
-                byte = os.path.getsize(f'{self.folder}{file}.{self.ext}')
-                if byte >= self.size and file < self.threads:
-                    file += 1
-            except FileNotFoundError:
-                pass
-
-            with open(f'{self.folder}{file}.{self.ext}', 'a') as out:
-                out.write(f'>{name}\n{seq}\n')
+        '''
+        Two streaming passes: the length of each sequence, then each sequence to the chunk
+        balancing them by total length, in input order. Chunks are always written as .fna.
+        '''
+        lengths = [len(seq) - seq.count('\n') for _,seq in fasta_parse(self.infile)]
+        bins = partition(lengths, self.threads)
+        records = ((name.replace(" ", "$~&"), seq) for name,seq in fasta_parse(self.infile))
+        distribute(records, [1] * len(lengths), bins, self.folder, '.fna')
     
         self.check = True
\ No newline at end of file
@@ -3,8 +3,8 @@
 # University of Wisconsin-Madison
 
 from fasta_parse import fasta_parse
+from scripts.chunks import partition, distribute
 import os
-import math
 
 
 class SplitProt:
@@ -13,7 +13,6 @@ class SplitProt:
         self.infile = infile
         self.folder = folder + 'split_files/'
         self.threads = threads
-        self.ext = self.infile.rsplit('.',1)[1]
         self.check = True
 
         self.check_format()
@@ -38,40 +37,29 @@ class SplitProt:
         if c == len(seq): # is nucl ATCGN format
             self.check = False
     
-    def remake_file(self):
+    def splitter(self):
         '''
-        Editing definition lines of proteins causes byte size to be off.
-        To fix, re-make the protein file before splitting.
+        Two streaming passes: the proteins and residues of each genome (a run of proteins
+        with the same name before the last _), then the proteins to the chunks bin-packing
+        whole genomes by residues, in input order. A genome whose proteins are not together
+        in the input is packed as separate runs. Chunks are always written as .faa.
         '''
-        self.remake = f'{self.folder}temp.protfile.faa'
-        with open(self.remake, 'w') as out:
-            for name,seq in fasta_parse(self.infile):
-                name = name.split(' # ',1)[0].replace(" ", "$~&")
-                out.write(f'>{name}\n{seq}\n')
-
-    def bytes_per_file(self):
-        self.main = os.path.getsize(self.remake)
-        self.size = math.ceil(self.main/self.threads)
-
-    def splitter(self):
-        self.remake_file()
-        self.bytes_per_file()
-        file = 1
-        prev = ''
-        for name,seq in fasta_parse(self.remake):
+        counts = []
+        residues = []
+        prev = None
+        for name,seq in self.proteins():
             base = name.rsplit('_',1)[0]
-            
-            try:
-                byte = os.path.getsize(f'{self.folder}{file}.{self.ext}')
-                if byte >= self.size and prev != base and file < self.threads:
-                    file += 1
-            except FileNotFoundError:
-                pass
-
-            with open(f'{self.folder}{file}.{self.ext}', 'a') as out:
-                out.write(f'>{name}\n{seq}\n')
-            
-            prev = base
+            if base != prev:
+                counts.append(0)
+                residues.append(0)
+                prev = base
+            counts[-1] += 1
+            residues[-1] += len(seq) - seq.count('\n')
+        bins = partition(residues, self.threads)
+        distribute(self.proteins(), counts, bins, self.folder, '.faa')
     
         self.check = True
-        os.system(f'rm {self.remake}')
\ No newline at end of file
+
+    def proteins(self):
+        for name,seq in fasta_parse(self.infile):
+            yield name.split(' # ',1)[0].replace(" ", "$~&"), seq
\ No newline at end of file
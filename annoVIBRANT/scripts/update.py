@@ -0,0 +1,124 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import json
+import itertools
+from fasta_parse import fasta_parse
+from scripts.hit_cache import digest, rescale
+from scripts.hmm_run import fingerprint
+
+
+def record(folder, checksum, params, bins, chunks):
+    '''
+    <folder>databases.json: input checksum, format, score, every database of the
+    registry with its fingerprint, and the chunks the proteins were searched in (the
+    number of bins the input was split into and the proteins of each chunk, in order),
+    written once a run or update is complete.
+    '''
+    stored = {'checksum': checksum, 'form': params['form'], 'score': params['score'],
+              'databases': [d + [fingerprint(d[1])] for d in params['databases']],
+              'bins': bins, 'chunks': chunks}
+    with open(f'{folder}databases.json.tmp', 'w') as f:
+        json.dump(stored, f, indent=1)
+    os.replace(f'{folder}databases.json.tmp', f'{folder}databases.json')
+
+def load(folder):
+    try:
+        with open(f'{folder}databases.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def changes(stored, databases):
+    '''
+    ({name: fingerprint} of databases whose stored hits are still valid, [names to search]).
+    A database is searched again if it is new or its fingerprint, column or threshold changed.
+    '''
+    old = {name: (col, score, identity) for name,_,col,score,identity in stored}
+    reuse = {}
+    search = []
+    for name,hmm,col,score in databases:
+        identity = fingerprint(hmm)
+        if old.get(name) == (col, score, identity):
+            reuse[name] = identity
+        else:
+            search.append(name)
+    return reuse, search
+
+def chunk_sizes(files):
+    '''
+    Proteins in each chunk file.
+    '''
+    sizes = []
+    for f in files:
+        with open(f) as chunk:
+            sizes.append(sum(1 for line in chunk if line[0] == '>'))
+    return sizes
+
+def split_proteins(path, folder, chunks):
+    '''
+    Proteins called in a finished nucl run (prodigal_results, in chunk order) back into the
+    chunks of the run, split_files/<n>.faa with chunks[n-1] proteins each, so searches get
+    the Z of the run and the rebuilt tables keep its protein order.
+    '''
+    split = f'{folder}split_files/'
+    os.mkdir(split)
+    proteins = fasta_parse(path)
+    files = []
+    for size in chunks:
+        if not size:
+            continue # scaffolds without genes
+        files.append(f'{split}{len(files)+1}.faa')
+        with open(files[-1], 'w', buffering=1048576) as out:
+            for name,seq in itertools.islice(proteins, size):
+                name = name.split(' # ',1)[0].replace(' ', '$~&')
+                out.write(f'>{name}\n{seq}')
+    return files
+
+
+class StoredHits:
+    '''
+    Hit cache stand-in for an update: the best hits of the databases that did not change,
+    from database_hits/<sample>.<db>.tsv, looked up by protein digest like the hit cache.
+    A protein missing from the table had no hit. Nothing is stored.
+    The same sequence can be in chunks of different sizes, so hits are kept by the Z of
+    the chunk each was searched in and a chunk gets back its own, as they were.
+    reuse: {database name: fingerprint}; files: the chunks of the run (split_proteins).
+    '''
+    def __init__(self, folder, base, files, reuse):
+        self.hits = {identity: {} for identity in reuse.values()}
+        wanted = {}
+        for name,identity in reuse.items():
+            with open(f'{folder}database_hits/{base}.{name}.tsv') as f:
+                next(f)
+                for line in f:
+                    prot,acc,evalue,score = line.strip('\n').split('\t')
+                    wanted.setdefault(prot.replace(' ', '$~&'), []).append((identity, (acc, evalue, score)))
+        for f,z in zip(files, chunk_sizes(files)):
+            for name,seq in fasta_parse(f):
+                name = name.split(' # ',1)[0].replace(' ', '$~&')
+                if name in wanted:
+                    d = digest(seq)
+                    for identity,hit in wanted.pop(name):
+                        self.hits[identity].setdefault(d, {})[z] = hit
+
+    def lookup(self, db, score, digests, z):
+        if db not in self.hits:
+            return {}
+        hits = self.hits[db]
+        found = {}
+        for d in digests:
+            searched = hits.get(d)
+            if not searched:
+                found[d] = ('', '', '')
+            elif z in searched:
+                found[d] = searched[z]
+            else: # not searched in a chunk of this size
+                other,(acc,evalue,score) = next(iter(searched.items()))
+                found[d] = (acc, rescale(evalue, other, z), score)
+        return found
+
+    def store(self, db, score, hits, z):
+        pass
@@ -0,0 +1,253 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import threading
+import subprocess
+from scripts import profiler
+
+
+POLL = 1 # seconds between looks at the queue folder
+HEARTBEAT = 30 # workers touch the jobs they run this often
+STALE = 300 # a running job not touched for this long goes back to the queue
+IDLE = 60 # warn when jobs wait this long and no worker is alive
+
+
+def folders(path):
+    return {name: f'{path}{name}/' for name in ('jobs', 'running', 'done', 'workers')}
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0
+
+def stopped_run(path):
+    '''
+    Id of the run whose coordinator wrote the stop marker, None without one.
+    '''
+    try:
+        with open(f'{path}stop') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def now(path):
+    '''
+    Current time on the file server, so modification times from other nodes compare.
+    '''
+    with open(f'{path}clock', 'w'):
+        pass
+    return os.stat(f'{path}clock').st_mtime
+
+def write(path, data):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.rename(f'{path}.tmp', path)
+
+
+class WorkQueue:
+    '''
+    Coordinator side of a work queue in a folder on a shared file system.
+    Each search is a JSON job in jobs/, named so the largest cost sorts first.
+    A worker claims a job by renaming it to running/ (atomic, so only one worker gets it),
+    writes the tblout to the path in the job and its result to done/.
+    The result is handed back to the run on its own pool; the pool holds the job
+    meanwhile, so the run waits for it. Jobs of a dead worker are queued again once stale.
+    One coordinator per folder: jobs and results left by an earlier one are cleared.
+    Jobs and the stop marker carry the id of this coordinator, so a worker started before
+    it on a reused folder does not take the old marker for its own.
+    A warning is printed when jobs wait and no worker is alive.
+    workers: local worker processes to start.
+    '''
+    def __init__(self, path, workers=0):
+        self.path = path
+        self.dirs = folders(path)
+        if os.path.exists(f'{path}stop'): # before the folders, which workers wait for
+            os.remove(f'{path}stop')
+        for name,d in self.dirs.items():
+            os.makedirs(d, exist_ok=True)
+            if name != 'workers': # workers already waiting keep their alive files
+                for f in os.listdir(d):
+                    os.remove(f'{d}{f}')
+        self.run = uuid.uuid4().hex
+        write(f'{path}run', self.run)
+        self.idle = None
+        self.waiting = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.collector = threading.Thread(target=self.collect, daemon=True)
+        self.collector.start()
+        script = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/annoVIBRANT.py'
+        self.workers = [subprocess.Popen([sys.executable, script, '--worker', path]) for _ in range(workers)]
+
+    def submit(self, job, cost, pool, callback, *args):
+        '''
+        Queue a job; callback(result, *args) runs on pool once it is done.
+        '''
+        name = f'{int(cost):024d}.{uuid.uuid4().hex}.json'
+        job = dict(job, run=self.run)
+        pool.hold()
+        with self.lock:
+            self.waiting[name] = (pool, callback, args)
+        write(f'{self.dirs["jobs"]}{name}', job)
+
+    def collect(self):
+        checked = time.time()
+        while not self.stopped.wait(POLL):
+            for name in os.listdir(self.dirs['done']):
+                if name.endswith('.tmp'):
+                    continue
+                with open(f'{self.dirs["done"]}{name}') as f:
+                    result = json.load(f)
+                os.remove(f'{self.dirs["done"]}{name}')
+                with self.lock:
+                    waiting = self.waiting.pop(name, None)
+                if waiting: # not a late copy of a job that was queued again
+                    pool,callback,args = waiting
+                    pool.submit(callback, result, *args, stage=2)
+                    pool.release()
+            if time.time() - checked > STALE / 5:
+                checked = time.time()
+                self.requeue()
+            self.check_workers()
+
+    def check_workers(self):
+        with self.lock:
+            waiting = bool(self.waiting)
+        if not waiting:
+            self.idle = None
+            return
+        if self.idle is None:
+            self.idle = time.time()
+        elif self.idle and time.time() - self.idle > IDLE:
+            clock = now(self.path)
+            alive = [f for f in os.listdir(self.dirs['workers']) if clock - mtime(f'{self.dirs["workers"]}{f}') < 2 * HEARTBEAT]
+            if alive:
+                self.idle = time.time()
+            else:
+                print(f'Warning: search jobs are waiting in {self.path} but no worker is alive. Start workers with: annoVIBRANT.py --worker {self.path} -t threads', flush=True)
+                self.idle = 0 # once, until the waiting jobs are done
+
+    def requeue(self):
+        clock = now(self.path)
+        for name in os.listdir(self.dirs['running']):
+            try:
+                if clock - os.stat(f'{self.dirs["running"]}{name}').st_mtime > STALE:
+                    os.rename(f'{self.dirs["running"]}{name}', f'{self.dirs["jobs"]}{name}')
+            except FileNotFoundError:
+                pass # finished meanwhile
+
+    def stop(self):
+        '''
+        Withdraw jobs nobody claimed and tell the workers to exit.
+        '''
+        self.stopped.set()
+        with self.lock:
+            for name in self.waiting:
+                if os.path.exists(f'{self.dirs["jobs"]}{name}'):
+                    os.remove(f'{self.dirs["jobs"]}{name}')
+        write(f'{self.path}stop', self.run)
+        for p in self.workers:
+            p.wait()
+
+
+class Worker:
+    '''
+    Runs jobs from the queue in path on threads threads until the coordinator stops the queue.
+    Can be started on any machine that sees the queue folder, the run's output folder
+    and the databases under the same paths, before or after the coordinator.
+    A stop marker already there at start is from an earlier run and is ignored.
+    '''
+    def __init__(self, path, threads):
+        self.path = path
+        self.dirs = folders(path)
+        self.host = socket.gethostname()
+        self.active = set()
+        self.lock = threading.Lock()
+        self.stale = stopped_run(path)
+        os.makedirs(self.dirs['workers'], exist_ok=True)
+        self.alive = f'{self.dirs["workers"]}{self.host}.{os.getpid()}.{uuid.uuid4().hex[:8]}' # several may share a process
+        open(self.alive, 'w').close()
+        threading.Thread(target=self.heartbeat, daemon=True).start()
+        try:
+            runners = [threading.Thread(target=self.runner) for _ in range(threads)]
+            for t in runners:
+                t.start()
+            for t in runners:
+                t.join()
+        finally:
+            os.remove(self.alive)
+
+    def stopped(self):
+        run = stopped_run(self.path)
+        return run is not None and run != self.stale
+
+    def claim(self):
+        if not os.path.exists(self.dirs['jobs']): # coordinator not started yet
+            return None
+        for name in sorted(os.listdir(self.dirs['jobs']), reverse=True):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                os.rename(f'{self.dirs["jobs"]}{name}', f'{self.dirs["running"]}{name}')
+            except FileNotFoundError:
+                continue # another worker got it
+            return name
+        return None
+
+    def runner(self):
+        while not self.stopped():
+            name = self.claim()
+            if not name:
+                time.sleep(POLL)
+                continue
+            with self.lock:
+                self.active.add(name)
+            try:
+                with open(f'{self.dirs["running"]}{name}') as f:
+                    job = json.load(f)
+                result = self.search(job)
+            except Exception as e:
+                result = {'returncode': -1, 'host': self.host, 'error': str(e), 'usage': {}}
+            finally:
+                with self.lock:
+                    self.active.discard(name)
+            write(f'{self.dirs["done"]}{name}', result)
+            try:
+                os.remove(f'{self.dirs["running"]}{name}')
+            except FileNotFoundError:
+                pass
+
+    def search(self, job):
+        '''
+        The tblout is written beside its final path and renamed, so it appears complete.
+        '''
+        temp = f'{job["out"]}.{self.host}.{os.getpid()}.tmp'
+        z = f'-Z {job["z"]} ' if job['z'] else ''
+        with profiler.Profiler().job('search') as used:
+            returncode = profiler.run(f'hmmsearch --tblout {temp} -T {job["score"]} {z}--cpu 1 --noali {job["hmm"]} {job["fasta"]} > /dev/null', shell=True)
+        if returncode == 0:
+            os.rename(temp, job['out'])
+        elif os.path.exists(temp):
+            os.remove(temp)
+        usage = {key: used[key] for key in ('cpu', 'read', 'written', 'max_rss_kb')}
+        return {'returncode': returncode, 'host': self.host, 'usage': usage}
+
+    def heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT)
+            os.utime(self.alive)
+            with self.lock:
+                active = list(self.active)
+            for name in active:
+                try:
+                    os.utime(f'{self.dirs["running"]}{name}')
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,44 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import sys
+import pytest
+
+# modules import each other both as scripts.<name> and <name>, as when annoVIBRANT.py runs
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [here, f'{here}/scripts']
+
+
+@pytest.fixture(autouse=True)
+def user_cache(tmp_path, monkeypatch):
+    '''
+    Indexes and shards go to a cache of the test, not the user's.
+    '''
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/cache')
+    return f'{tmp_path}/cache/annoVIBRANT/'
+
+@pytest.fixture
+def aux(tmp_path):
+    '''
+    VIBRANT auxiliary files (files/), without a final newline as shipped.
+    '''
+    folder = tmp_path / 'files'
+    folder.mkdir()
+    (folder / 'VIBRANT_names.tsv').write_text('K00001\tkinase\nPF00001\tdomain')
+    (folder / 'VIBRANT_AMGs.tsv').write_text('KO\nK00001\n')
+    (folder / 'VIBRANT_categories.tsv').write_text('acc\tvscore\nK00001\t50')
+    (folder / 'VIBRANT_KEGG_pathways_summary.tsv').write_text('map00010\tCarbohydrate metabolism\tGlycolysis\tK00001~K00002\n')
+    return f'{folder}/'
+
+@pytest.fixture
+def chunk(tmp_path):
+    '''
+    Run folder with one protein chunk, split_files/1.faa; c and d are copies of a and b.
+    '''
+    folder = tmp_path / 'run'
+    for name in ('split_files', 'parsed_hmm_results', 'annotations_temp'):
+        (folder / name).mkdir(parents=True)
+    (folder / 'split_files' / '1.faa').write_text('>g_1\nMKL\n>g_2\nMKV\n>g_3\nmkl*\n>g_4\nMKV\n')
+    return f'{folder}/'
@@ -0,0 +1,29 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+from collections import Counter
+import pytest
+from scripts.api import Table
+from scripts.combine_clean import amg_summary
+
+
+class Tables:
+    names = {'K00001': 'alcohol dehydrogenase'}
+    pathways = {'K00001': [('map00010', 'Carbohydrate metabolism', 'Glycolysis'), ('map00071', 'Lipid metabolism', 'Fatty acid degradation')]}
+
+def test_amg_summary():
+    counts, paths = amg_summary(Counter(['K00001', 'K00002', 'K00001']), Tables)
+    assert counts == [['2', 'K00001', 'alcohol dehydrogenase'], ['1', 'K00002', 'hypothetical protein']]
+    assert paths[1] == ['map00071', 'Lipid metabolism', 'Fatty acid degradation', '2', 'K00001']
+    assert paths[2] == ['None', 'None', 'None', '1', 'K00002']
+
+def test_frame_numeric_columns():
+    pandas = pytest.importorskip('pandas')
+    table = Table(['protein', 'KEGG evalue', 'KEGG score', 'KEGG name', 'AMG count'], [['p1', '1e-10', '40.5', 'x', '2'], ['p2', '', '', '', '1']])
+    frame = table.frame()
+    assert frame['KEGG evalue'][0] == 1e-10
+    assert pandas.isna(frame['KEGG score'][1])
+    assert frame['AMG count'].tolist() == [2, 1]
+    assert frame['KEGG name'].tolist() == ['x', '']
+    assert [row['protein'] for row in table] == ['p1', 'p2']
@@ -0,0 +1,29 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import shutil
+from scripts import aux_tables
+from scripts.aux_tables import AuxTables
+
+
+def test_index_in_user_cache(aux, user_cache):
+    built = AuxTables(aux)
+    assert 'annoVIBRANT_index.sqlite' not in os.listdir(aux)
+    assert aux_tables.check_index(aux).startswith(user_cache)
+    loaded = AuxTables(aux)
+    assert (loaded.names, loaded.amgs, loaded.cats, loaded.pathways) == (built.names, built.amgs, built.cats, built.pathways)
+    assert loaded.pathways['K00002'] == [('map00010', 'Carbohydrate metabolism', 'Glycolysis')]
+
+def test_index_in_install_folder_used(aux, user_cache):
+    AuxTables(aux)
+    shutil.move(aux_tables.check_index(aux), f'{aux}annoVIBRANT_index.sqlite')
+    assert aux_tables.check_index(aux) == f'{aux}annoVIBRANT_index.sqlite'
+
+def test_index_rebuilt_when_sources_change(aux):
+    AuxTables(aux)
+    with open(f'{aux}VIBRANT_names.tsv', 'a') as f:
+        f.write('\nK00002\tsynthase')
+    assert aux_tables.check_index(aux) is None
+    assert AuxTables(aux).names['K00002'] == 'synthase'
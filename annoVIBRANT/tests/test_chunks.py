@@ -0,0 +1,45 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+from scripts.chunks import chunk_base, chunk_files, partition, distribute
+from scripts.split_nucl import SplitNucl
+
+
+def test_partition_longest_first():
+    # 9 and 7 open the two bins, then each item goes to the lighter one
+    assert partition([1, 9, 2, 7, 3], 2) == [1, 0, 0, 1, 1]
+
+def test_partition_balances_load():
+    sizes = [50, 40, 30, 20, 10, 10, 5]
+    assign = partition(sizes, 3)
+    loads = [sum(s for s,b in zip(sizes, assign) if b == i) for i in range(3)]
+    assert max(loads) - min(loads) <= 10
+
+def test_partition_ties_in_input_order():
+    assert partition([5, 5, 5, 5], 2) == [0, 1, 0, 1]
+
+def test_partition_more_bins_than_items():
+    assert partition([3, 1], 4) == [0, 1]
+
+def test_chunk_files_numeric_order(tmp_path):
+    for name in ('10.faa', '2.faa', '1.faa', '1.KEGG.faa', 'x.faa', '3.fna'):
+        (tmp_path / name).write_text('')
+    folder = f'{tmp_path}/'
+    assert chunk_files(folder, '.faa') == [f'{folder}1.faa', f'{folder}2.faa', f'{folder}10.faa']
+
+def test_chunk_base():
+    assert chunk_base('/a/b.c/12.KEGG.temp') == '12'
+
+def test_distribute_streams_units_in_order(tmp_path):
+    records = iter([('a', 'MK\n'), ('b', 'ML\n'), ('c', 'MV\n'), ('d', 'MA\n')])
+    distribute(records, [2, 1, 1], [1, 0, 1], f'{tmp_path}/', '.faa')
+    assert (tmp_path / '1.faa').read_text() == '>c\nMV\n\n'
+    assert (tmp_path / '2.faa').read_text() == '>a\nMK\n\n>b\nML\n\n>d\nMA\n\n'
+
+def test_split_nucl(tmp_path):
+    fna = tmp_path / 'input.fna'
+    fna.write_text('>s1 x\nACGTACGT\n>s2\nACG\n>s3\nACGTAC\n')
+    SplitNucl(str(fna), f'{tmp_path}/', 2)
+    assert (tmp_path / 'split_files' / '1.fna').read_text() == '>s1$~&x\nACGTACGT\n\n'
+    assert (tmp_path / 'split_files' / '2.fna').read_text() == '>s2\nACG\n\n>s3\nACGTAC\n\n'
@@ -0,0 +1,21 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import socket
+from scripts import daemon
+
+
+def test_peer_uid():
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    with a, b:
+        assert daemon.peer_uid(a) == os.getuid()
+
+def test_alive(tmp_path):
+    path = f'{tmp_path}/s.sock'
+    assert not daemon.alive(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.bind(path)
+        s.listen()
+        assert daemon.alive(path)
@@ -0,0 +1,38 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+from scripts.annotations import Annotations
+from scripts.hmm_run import HMMsearch
+
+
+def searcher(folder, dedup):
+    return HMMsearch(folder, [['KEGG', f'{folder}KEGG.hmm', 2, '']], '40', None, None, dedup=dedup)
+
+def test_unique_lists_copies(chunk):
+    proteins, z = searcher(chunk, True).unique(f'{chunk}split_files/1.faa', '1')
+    assert [p[0] for p in proteins] == ['g_1', 'g_2']
+    assert z == 4 # searches keep the Z of the whole chunk
+    assert open(f'{chunk}split_files/1.dups.tsv').read() == 'g_3\tg_1\ng_4\tg_2\n'
+
+def test_unique_without_dedup(chunk):
+    proteins, z = searcher(chunk, False).unique(f'{chunk}split_files/1.faa', '1')
+    assert len(proteins) == z == 4
+
+def test_copies_annotated(chunk, aux):
+    searcher(chunk, True).unique(f'{chunk}split_files/1.faa', '1')
+    with open(f'{chunk}parsed_hmm_results/1.KEGG.tsv', 'w') as f:
+        f.write('protein\taccession\tevalue\tscore\ng_1\tK00001\t1e-10\t40.0\n')
+    Annotations('1', chunk, aux, 'prot', ['KEGG'])
+    with open(f'{chunk}annotations_temp/1.best.tsv') as f:
+        best = [line.split('\t')[:3] for line in f]
+    assert best == [['g_1', 'g', 'K00001'], ['g_2', 'g', ''], ['g_3', 'g', 'K00001'], ['g_4', 'g', '']]
+    with open(f'{chunk}annotations_temp/1.amgs.tsv') as f:
+        assert [line.split('\t')[0] for line in f] == ['g_1', 'g_3']
+
+def test_no_copies_without_dedup(chunk, aux):
+    with open(f'{chunk}parsed_hmm_results/1.KEGG.tsv', 'w') as f:
+        f.write('protein\taccession\tevalue\tscore\ng_1\tK00001\t1e-10\t40.0\n')
+    Annotations('1', chunk, aux, 'prot', ['KEGG'])
+    with open(f'{chunk}annotations_temp/1.amgs.tsv') as f:
+        assert [line.split('\t')[0] for line in f] == ['g_1']
@@ -0,0 +1,23 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import sqlite3
+from scripts.gene_cache import GeneCache, fill, scaffold_digest, NAME, SEQNUM
+
+
+def test_fill():
+    assert fill(f'>{NAME}_1 # ID={SEQNUM}_1\n', 'scaf', 3) == '>scaf_1 # ID=3_1\n'
+
+def test_digest_keeps_case():
+    assert scaffold_digest('ACGT\nACGT') == scaffold_digest('ACGTACGT') != scaffold_digest('acgtacgt')
+
+def test_store_and_evict(tmp_path):
+    cache = GeneCache(f'{tmp_path}/genes.db', 300)
+    cache.store([('d0', 'faa', 'ffn', 'gff')])
+    assert cache.lookup(['d0', 'd1']) == {'d0': ('faa', 'ffn', 'gff')}
+    for i in range(1, 400):
+        cache.store([(f'd{i}', 'faa', 'ffn', 'gff')])
+    with sqlite3.connect(f'{tmp_path}/genes.db') as con:
+        assert con.execute('SELECT COUNT(*) FROM genes').fetchone()[0] <= 303
+    assert cache.lookup(['d399']) == {'d399': ('faa', 'ffn', 'gff')}
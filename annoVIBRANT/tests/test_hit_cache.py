@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import sqlite3
+import threading
+from scripts.hit_cache import HitCache, digest, rescale
+
+
+def test_digest_ignores_layout():
+    assert digest('MKL\nAV*') == digest('mklav')
+
+def test_rescale():
+    assert rescale('2e-10', 100, 100) == '2e-10'
+    assert rescale('2e-10', 100, 300) == '6e-10'
+    assert rescale('', 100, 300) == ''
+
+def test_lookup_rescales_to_chunk(tmp_path):
+    cache = HitCache(f'{tmp_path}/hits.db', 100)
+    cache.store('KEGG', '40', [('d1', 'K00001', '4e-20', '80.1'), ('d2', '', '', '')], 200)
+    assert cache.lookup('KEGG', '40', ['d1', 'd2', 'd3'], 100) == {'d1': ('K00001', '2e-20', '80.1'), 'd2': ('', '', '')}
+    assert cache.lookup('KEGG', '50', ['d1'], 100) == {}
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = HitCache(f'{tmp_path}/hits.db', 2)
+    cache.store('KEGG', '40', [('d1', 'K1', '1e-5', '50')], 10)
+    cache.store('KEGG', '40', [('d2', 'K2', '1e-5', '50')], 10)
+    cache.lookup('KEGG', '40', ['d1'], 10) # d2 is now the oldest
+    cache.store('KEGG', '40', [('d3', 'K3', '1e-5', '50')], 10)
+    assert set(cache.lookup('KEGG', '40', ['d1', 'd2', 'd3'], 10)) == {'d1', 'd3'}
+
+def test_table_without_z_dropped(tmp_path):
+    with sqlite3.connect(f'{tmp_path}/hits.db') as con:
+        con.execute('CREATE TABLE hits (digest TEXT, db TEXT, score TEXT, accession TEXT, evalue TEXT, bitscore TEXT, used REAL, PRIMARY KEY (digest, db, score))')
+        con.execute("INSERT INTO hits VALUES ('d1', 'KEGG', '40', 'K1', '1e-5', '50', 0)")
+    assert HitCache(f'{tmp_path}/hits.db', 10).lookup('KEGG', '40', ['d1'], 10) == {}
+
+def test_concurrent_runs(tmp_path):
+    path = f'{tmp_path}/hits.db'
+    HitCache(path, 1000)
+    def run(n):
+        cache = HitCache(path, 1000)
+        for i in range(20):
+            cache.store('KEGG', '40', [(f'{n}.{i}', 'K1', '1e-5', '50')], 10)
+            cache.lookup('KEGG', '40', [f'{n}.{i}'], 10)
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    found = HitCache(path, 1000).lookup('KEGG', '40', [f'{n}.{i}' for n in range(4) for i in range(20)], 10)
+    assert len(found) == 80
+
+def test_size_checked_every_percent(tmp_path):
+    cache = HitCache(f'{tmp_path}/hits.db', 300)
+    for i in range(400):
+        cache.store('KEGG', '40', [(f'd{i}', 'K1', '1e-5', '50')], 10)
+    with sqlite3.connect(f'{tmp_path}/hits.db') as con:
+        assert con.execute('SELECT COUNT(*) FROM hits').fetchone()[0] <= 303
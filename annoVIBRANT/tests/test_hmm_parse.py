@@ -0,0 +1,32 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import io
+from scripts.hmm_parse import best_hits, tblout_lines, write_best
+
+
+TBLOUT = '''# target name  accession  query name  accession  E-value  score
+p1 - K00001 - 1e-10 40.0 x
+p2 - K00002 - 5e-20 60.0 x
+p1 - K00003 - 1e-12 45.0 x
+p1 - K00004 - 1e-12 46.0 x
+'''
+
+def test_tblout_lines():
+    rows = list(tblout_lines(io.StringIO(TBLOUT), 2))
+    assert rows[0] == ('p1', 'K00001', '1e-10', '40.0')
+    assert len(rows) == 4
+
+def test_lowest_evalue_first_wins_ties():
+    best = best_hits(tblout_lines(io.StringIO(TBLOUT), 2))
+    assert best == [('p1', 'K00003', '1e-12', '45.0'), ('p2', 'K00002', '5e-20', '60.0')]
+
+def test_equal_evalues_compare_as_numbers():
+    best = best_hits([('p1', 'A', '1.0e-5', '30'), ('p1', 'B', '1e-05', '31')])
+    assert best == [('p1', 'A', '1.0e-5', '30')]
+
+def test_write_best_keeps_full(tmp_path):
+    write_best(tblout_lines(io.StringIO(TBLOUT), 2), f'{tmp_path}/best.tsv', f'{tmp_path}/full.tsv')
+    assert (tmp_path / 'best.tsv').read_text() == 'protein\taccession\tevalue\tscore\np1\tK00003\t1e-12\t45.0\np2\tK00002\t5e-20\t60.0\n'
+    assert len((tmp_path / 'full.tsv').read_text().splitlines()) == 4
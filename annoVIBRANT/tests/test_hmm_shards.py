@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import shutil
+import pytest
+from scripts import hmm_shards
+
+
+PROFILE = 'HMMER3/f\nNAME  p{}\nLENG  10\n//\n'
+
+def database(tmp_path, profiles):
+    (tmp_path / 'db').mkdir()
+    (tmp_path / 'db' / 'test.hmm').write_text(''.join(PROFILE.format(i) for i in range(profiles)))
+    return f'{tmp_path}/db/'
+
+def test_split_keeps_profile_order(tmp_path):
+    db = database(tmp_path, 5)
+    (tmp_path / 'out').mkdir()
+    count = hmm_shards.split_hmm(f'{db}test.hmm', 2, f'{tmp_path}/out/')
+    assert count == 2
+    assert ''.join((tmp_path / 'out' / f'{i}.hmm').read_text() for i in range(count)) == (tmp_path / 'db' / 'test.hmm').read_text()
+
+def test_write_failure_raises_shard_error(tmp_path, monkeypatch):
+    db = database(tmp_path, 3)
+    def full(hmm, n, folder):
+        open(f'{folder}0.hmm', 'w').close()
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(hmm_shards, 'split_hmm', full)
+    with pytest.raises(hmm_shards.ShardError, match='No space left on device'):
+        hmm_shards.build_shards(db, 'test.hmm', 2)
+    parent = hmm_shards.shard_dirs(db, 'test.hmm', 2)[0].rstrip('/').rsplit('/',1)[0]
+    assert os.listdir(parent) == []
+
+def test_unwritable_cache_raises_shard_error(tmp_path, monkeypatch):
+    db = database(tmp_path, 3)
+    (tmp_path / 'not_a_folder').write_text('')
+    monkeypatch.setenv('XDG_CACHE_HOME', f'{tmp_path}/not_a_folder')
+    with pytest.raises(hmm_shards.ShardError, match='Could not write HMM shards'):
+        hmm_shards.build_shards(db, 'test.hmm', 2)
+
+@pytest.mark.skipif(not shutil.which('hmmpress'), reason='needs HMMER')
+def test_shards_built_in_user_cache(tmp_path, user_cache):
+    db = database(tmp_path, 4)
+    shards = hmm_shards.shard_databases([['test', f'{db}test.hmm', 0, '']], 2)['test']
+    assert len(shards) == 2 and all(s.startswith(user_cache) for s in shards)
+    assert os.listdir(db) == ['test.hmm']
+    assert hmm_shards.check_shards(db, 'test.hmm', 2) == shards
+
+def test_shards_next_to_database_used(tmp_path):
+    db = database(tmp_path, 4)
+    folder = hmm_shards.shard_dirs(db, 'test.hmm', 2)[1]
+    os.makedirs(folder)
+    with open(f'{folder}shards.ok', 'w') as f:
+        f.write(f'{hmm_shards.fingerprint(db + "test.hmm")}\n2\n')
+    assert hmm_shards.check_shards(db, 'test.hmm', 2) == [f'{folder}0.hmm', f'{folder}1.hmm']
@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import json
+from scripts.manifest import Manifest, checksum
+
+
+def started(tmp_path, params=None):
+    infile = tmp_path / 'input.fna'
+    if not infile.exists():
+        infile.write_text('>a\nACGT\n')
+    run = Manifest(f'{tmp_path}/')
+    run.start(str(infile), params or {'threads': 2})
+    return run, str(infile)
+
+def test_resume_verifies_outputs(tmp_path):
+    run, infile = started(tmp_path)
+    out = tmp_path / '1.faa'
+    out.write_text('>p\nMK\n')
+    run.record('1', 'prodigal', '', [str(out)])
+    resumed = Manifest(f'{tmp_path}/')
+    assert resumed.load(infile, {'threads': 2})
+    assert resumed.done('1', 'prodigal')
+    out.write_text('>p\nMKL\n') # changed since it was recorded
+    assert not resumed.done('1', 'prodigal')
+    out.unlink()
+    assert not resumed.done('1', 'prodigal')
+
+def test_load_rejects_other_input_or_params(tmp_path):
+    run, infile = started(tmp_path)
+    assert not Manifest(f'{tmp_path}/').load(infile, {'threads': 4})
+    with open(infile, 'a') as f:
+        f.write('>b\nTTTT\n')
+    assert not Manifest(f'{tmp_path}/').load(infile, {'threads': 2})
+
+def test_partial_last_line_ignored(tmp_path):
+    run, infile = started(tmp_path)
+    run.record('1', 'split', '', [])
+    with open(run.path, 'a') as f:
+        f.write('{"chunk": "2", "sta')
+    resumed = Manifest(f'{tmp_path}/')
+    assert resumed.load(infile, {'threads': 2})
+    assert resumed.done('1', 'split')
+    assert not resumed.done('2', 'split')
+
+def test_redone_stage_invalidates_later_ones(tmp_path):
+    run, infile = started(tmp_path)
+    run.record('1', 'search', 'KEGG', [])
+    resumed = Manifest(f'{tmp_path}/')
+    resumed.load(infile, {'threads': 2})
+    assert resumed.done('1', 'search', 'KEGG')
+    resumed.record('1', 'prodigal', '', [])
+    assert not resumed.done('1', 'search', 'KEGG')
+    assert resumed.done('1', 'prodigal')
+
+def test_rewritten_output_same_size(tmp_path):
+    run, infile = started(tmp_path)
+    out = tmp_path / '1.faa'
+    out.write_text('>p\nMK\n')
+    run.record('1', 'prodigal', '', [str(out)])
+    stat = os.stat(out)
+    out.write_text('>q\nMK\n')
+    os.utime(out, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert not run.done('1', 'prodigal')
+
+def test_older_manifest_checked_by_md5(tmp_path):
+    run, infile = started(tmp_path)
+    out = tmp_path / '1.faa'
+    out.write_text('>p\nMK\n')
+    with open(run.path, 'a') as f:
+        f.write(json.dumps({'chunk': '1', 'stage': 'prodigal', 'db': '', 'outputs': {str(out): checksum(str(out))}}) + '\n')
+    resumed = Manifest(f'{tmp_path}/')
+    assert resumed.load(infile, {'threads': 2})
+    assert resumed.done('1', 'prodigal')
+    out.write_text('>p\nML\n')
+    assert not resumed.done('1', 'prodigal')
@@ -0,0 +1,21 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+from scripts.split_prot import SplitProt
+
+
+def split(tmp_path, text, bins):
+    faa = tmp_path / 'input.faa'
+    faa.write_text(text)
+    SplitProt(str(faa), f'{tmp_path}/', bins)
+    return [(tmp_path / 'split_files' / f'{b}.faa').read_text() if (tmp_path / 'split_files' / f'{b}.faa').exists() else '' for b in range(1, bins+1)]
+
+def test_genomes_kept_whole(tmp_path):
+    chunks = split(tmp_path, '>g1_1 # 1 # 9\nMKLAV\n>g1_2\nMKL\n>g2_1\nMK\n>g3_1\nMKLAVM\n', 2)
+    assert chunks == ['>g1_1\nMKLAV\n\n>g1_2\nMKL\n\n', '>g2_1\nMK\n\n>g3_1\nMKLAVM\n\n']
+
+def test_input_order_kept(tmp_path):
+    # g1 is not contiguous: its runs are packed separately and no protein moves ahead of another
+    chunks = split(tmp_path, '>g1_1\nMKLAVMKLAV\n>g2_1\nMK\n>g1_2\nMK\n', 1)
+    assert chunks == ['>g1_1\nMKLAVMKLAV\n\n>g2_1\nMK\n\n>g1_2\nMK\n\n']
@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+from scripts import update
+from scripts.hmm_run import fingerprint
+from scripts.hit_cache import digest
+
+
+def database(tmp_path, name, text):
+    hmm = tmp_path / f'{name}.HMM'
+    hmm.write_text(text)
+    return str(hmm)
+
+def test_changes(tmp_path):
+    kegg = database(tmp_path, 'KEGG', 'kegg profiles')
+    pfam = database(tmp_path, 'Pfam', 'pfam profiles')
+    vog = database(tmp_path, 'VOG', 'vog profiles')
+    stored = [['KEGG', kegg, 2, '', fingerprint(kegg)],
+              ['Pfam', pfam, 2, '', fingerprint(pfam)],
+              ['VOG', vog, 2, '', fingerprint(vog)]]
+    database(tmp_path, 'Pfam', 'pfam profiles, newer release')
+    extra = database(tmp_path, 'extra', 'extra profiles')
+    reuse, search = update.changes(stored, [['KEGG', kegg, 2, ''], ['Pfam', pfam, 2, ''], ['VOG', vog, 2, '50'], ['extra', extra, 0, '']])
+    assert reuse == {'KEGG': fingerprint(kegg)}
+    assert search == ['Pfam', 'VOG', 'extra']
+
+def test_record_and_load(tmp_path):
+    kegg = database(tmp_path, 'KEGG', 'kegg profiles')
+    params = {'form': 'nucl', 'score': '40', 'databases': [['KEGG', kegg, 2, '']]}
+    update.record(f'{tmp_path}/', 'abc', params, 3, [4, 0, 2])
+    stored = update.load(f'{tmp_path}/')
+    assert stored['databases'] == [['KEGG', kegg, 2, '', fingerprint(kegg)]]
+    assert (stored['bins'], stored['chunks']) == (3, [4, 0, 2])
+    assert update.load(f'{tmp_path}/missing/') is None
+
+def test_split_proteins_to_original_chunks(tmp_path):
+    faa = tmp_path / 'proteins.faa'
+    faa.write_text(''.join(f'>s{i}_1 # 1 # 90 # 1 # ID=1_1\nMK\n' for i in range(6)))
+    files = update.split_proteins(str(faa), f'{tmp_path}/', [4, 0, 2])
+    assert files == [f'{tmp_path}/split_files/1.faa', f'{tmp_path}/split_files/2.faa']
+    assert update.chunk_sizes(files) == [4, 2]
+    assert open(files[1]).read() == '>s4_1\nMK\n>s5_1\nMK\n'
+
+def test_stored_hits_by_chunk(tmp_path):
+    # the same sequence in a chunk of 3 and a chunk of 1, each with the E-value of its own chunk
+    faa = tmp_path / 'proteins.faa'
+    faa.write_text('>a_1\nMKL\n>a_2\nMKV\n>a_3\nMKA\n>b_1\nMKL\n')
+    files = update.split_proteins(str(faa), f'{tmp_path}/', [3, 1])
+    kegg = database(tmp_path, 'KEGG', 'kegg profiles')
+    (tmp_path / 'database_hits').mkdir()
+    (tmp_path / 'database_hits' / 'sample.KEGG.tsv').write_text('protein\taccession\tevalue\tscore\na_1\tK1\t3e-10\t40\nb_1\tK1\t1e-10\t40\n')
+    stored = update.StoredHits(f'{tmp_path}/', 'sample', files, {'KEGG': fingerprint(kegg)})
+    mkl, mkv = digest('MKL'), digest('MKV')
+    assert stored.lookup(fingerprint(kegg), '40', [mkl, mkv], 3) == {mkl: ('K1', '3e-10', '40'), mkv: ('', '', '')}
+    assert stored.lookup(fingerprint(kegg), '40', [mkl], 1) == {mkl: ('K1', '1e-10', '40')}
+    assert stored.lookup(fingerprint(kegg), '40', [mkl], 2) == {mkl: ('K1', '2e-10', '40')}
+    assert stored.lookup('other', '40', [mkl], 3) == {}
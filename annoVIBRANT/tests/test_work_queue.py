@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+# Author: Kristopher Kieft
+# University of Wisconsin-Madison
+
+import os
+import json
+import time
+import threading
+import pytest
+from scripts import work_queue
+from scripts.job_pool import JobPool
+from scripts.work_queue import WorkQueue, Worker
+
+
+@pytest.fixture
+def queue(tmp_path):
+    coordinator = WorkQueue(f'{tmp_path}/queue/')
+    yield coordinator
+    if not os.path.exists(f'{coordinator.path}stop'): # not stopped by the test
+        coordinator.stop()
+
+def claimer(path):
+    '''
+    A worker with no runner threads: set up as on a node, then claims by hand.
+    '''
+    return Worker(path, 0)
+
+def test_start_clears_earlier_run(tmp_path):
+    path = f'{tmp_path}/'
+    for name in ('jobs', 'running', 'done', 'workers'):
+        os.makedirs(f'{path}{name}')
+        open(f'{path}{name}/old', 'w').close()
+    open(f'{path}stop', 'w').close()
+    queue = WorkQueue(path)
+    try:
+        assert not os.path.exists(f'{path}stop')
+        assert [os.listdir(f'{path}{name}') for name in ('jobs', 'running', 'done', 'workers')] == [[], [], [], ['old']]
+        with open(f'{path}run') as f:
+            assert json.load(f) == queue.run
+    finally:
+        queue.stop()
+
+def test_claim_largest_first_and_once(queue):
+    pool = JobPool(1)
+    for cost in (10, 300, 20):
+        queue.submit({'cost': cost}, cost, pool, None)
+    assert pool.held == 3
+    claimed = []
+    threads = [threading.Thread(target=lambda: claimed.append(claimer(queue.path).claim())) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    names = sorted(name for name in claimed if name)
+    assert len(names) == 3
+    with open(f'{queue.path}running/{max(names)}') as f:
+        assert json.load(f) == {'cost': 300, 'run': queue.run}
+
+def test_result_handed_back(queue):
+    pool = JobPool(1)
+    results = []
+    queue.submit({}, 1, pool, lambda result, chunk: results.append((result, chunk)), 'chunk 1')
+    name = claimer(queue.path).claim()
+    work_queue.write(f'{queue.path}done/{name}', {'returncode': 0})
+    pool.wait()
+    assert results == [({'returncode': 0}, 'chunk 1')]
+
+def test_stale_job_requeued(queue):
+    pool = JobPool(1)
+    queue.submit({}, 1, pool, None)
+    queue.submit({}, 2, pool, None)
+    worker = claimer(queue.path)
+    dead, alive = worker.claim(), worker.claim()
+    old = time.time() - work_queue.STALE - 60
+    os.utime(f'{queue.path}running/{dead}', (old, old))
+    queue.requeue()
+    assert os.listdir(f'{queue.path}jobs') == [dead]
+    assert os.listdir(f'{queue.path}running') == [alive]
+
+def test_earlier_stop_marker_ignored(tmp_path):
+    path = f'{tmp_path}/'
+    WorkQueue(path).stop()
+    worker = claimer(path) # started after the earlier run, before the next
+    assert not worker.stopped()
+    queue = WorkQueue(path)
+    assert not worker.stopped()
+    queue.stop()
+    assert worker.stopped()
+
+def test_worker_runs_jobs_until_stopped(queue, tmp_path):
+    runner = threading.Thread(target=Worker, args=(queue.path, 1))
+    runner.start()
+    pool = JobPool(1)
+    results = []
+    job = {'hmm': f'{tmp_path}/missing.hmm', 'fasta': f'{tmp_path}/missing.faa', 'out': f'{tmp_path}/1.KEGG.hmmtbl', 'score': '40', 'z': 4}
+    queue.submit(job, 1, pool, lambda result: results.append(result))
+    pool.wait()
+    assert results[0]['returncode'] != 0
+    assert [f for f in os.listdir(tmp_path) if f.endswith('.tmp')] == []
+    assert len(os.listdir(f'{queue.path}workers')) == 1
+    queue.stop()
+    runner.join(10)
+    assert not runner.is_alive()
+    assert os.listdir(f'{queue.path}workers') == []